@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: async_crawler.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Concurrent crawler to prefetch several covers at once """
+
+import asyncio, functools, random
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from io import BytesIO
+
+from crawler import Cover, SourceFinding, get_cover_source
+from extractors import get_extractor
+
+
+class AsyncSourceFinding():
+    """
+    Asyncio front-end of SourceFinding, requests go through
+    a pooled session in a bounded thread pool, limited both
+    in total and per host, and the pages are parsed by the
+    cover source plugins.
+    """
+
+    def __init__(self, max_connections = 8, per_host = 2, listing_urls = None, timeout = 30, extractor = None):
+        """
+        Constructor of the class AsyncSourceFinding.
+
+        :param max_connections: optional, maximum number of requests at the same time.
+        :param per_host: optional, maximum number of requests at the same time to a host.
+        :param listing_urls: optional, dict language -> listing url, to use other servers.
+        :param timeout: optional, seconds to wait for every request.
+        :param extractor: optional, extractors backend name, the fastest available by default.
+        """
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+
+        self.extractor = get_extractor(extractor)
+        self.listing_urls = listing_urls or {}
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+
+        self._connections = None
+        self._host_limits = {}
+        self._listings = {}
+
+        # language and exception of every cover the last prefetch could not fetch
+        self.errors = []
+
+    def close(self):
+        """ Release the connections and the threads """
+        self._executor.shutdown(wait=True)
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def _run(self, function, *args, **kwargs):
+        """ Run a blocking call in the thread pool """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def _get(self, url):
+        """ GET an url respecting the global and per host limits """
+        if self._connections is None:
+            self._connections = asyncio.Semaphore(self.max_connections)
+
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+
+        async with self._connections:
+            async with self._host_limits[host]:
+                req = await self._run(self._session.get, url, headers=SourceFinding._HEADERS, timeout=self.timeout)
+
+        req.raise_for_status()
+        return req
+
+    async def _get_html(self, url, source):
+        req = await self._get(url)
+        if source.encoding is not None:
+            req.encoding = source.encoding
+
+        return req.text
+
+    async def _fetch_listing(self, source):
+        url = self.listing_urls.get(source.language, source.listing_url)
+
+        return await self._run(source.parse_listing, self.extractor, await self._get_html(url, source), url)
+
+    async def _get_listing(self, language):
+        """ Links of the listing page of a language, fetched once per prefetch """
+        if language not in self._listings:
+            self._listings[language] = asyncio.ensure_future(self._fetch_listing(get_cover_source(language)))
+
+        return await self._listings[language]
+
+    async def fetch_cover(self, language, url = None):
+        """
+        Fetch the text and the image of a cover.
+
+        :param language: str with the language of the source, key of the sources registry.
+        :param url: optional, url of the page, a random one from the listing if not given.
+        :return: Cover fetched.
+        """
+        source = get_cover_source(language)
+
+        # corpus covers are local files, no connection is needed
+        if source.corpus_dir is not None and url is None:
+            return await self._run(source.random_cover, None)
+        if url is not None and url.startswith(source.CORPUS_SCHEME):
+            return await self._run(source.get_corpus_cover, url)
+
+        if url is None:
+            url = random.choice(await self._get_listing(language))
+
+        text, image_link = await self._run(source.parse_source, self.extractor, await self._get_html(url, source), url)
+
+        image = Image.open(BytesIO((await self._get(image_link)).content))
+        image.load()
+
+        return Cover(url, language, text, image)
+
+    async def prefetch(self, n_covers, languages = ("es", "en")):
+        """
+        Fetch n_covers random covers in parallel.
+
+        :param n_covers: int with the number of covers to fetch.
+        :param languages: optional, languages where to choose the sources from.
+        :return: list with the covers fetched, failed ones are left out and kept in errors.
+        """
+        # semaphores belong to the running loop
+        self._connections = asyncio.Semaphore(self.max_connections)
+        self._host_limits = {}
+        self._listings = {}
+
+        chosen = [random.choice(languages) for _ in range(n_covers)]
+        covers = await asyncio.gather(*[self.fetch_cover(language) for language in chosen], return_exceptions=True)
+
+        self.errors = [(language, cover) for language, cover in zip(chosen, covers) if isinstance(cover, BaseException)]
+        return [cover for cover in covers if not isinstance(cover, BaseException)]
+
+    def prefetch_covers(self, n_covers, languages = ("es", "en")):
+        """ Blocking version of prefetch """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.prefetch(n_covers, languages))
+        finally:
+            loop.close()
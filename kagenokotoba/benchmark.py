@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: benchmark.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Throughput and memory benchmark for the stego algorithms """
+
+import os, sys, time, math, json, random, string, platform, tempfile, argparse, subprocess, tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import numpy as np
+from PIL import Image
+import text_stego as stego
+import extractors
+from crawler import get_cover_source
+
+
+STAGES = ("text_hide", "text_unhide", "image_embed", "image_extract")
+
+DEFAULT_SIZES = (1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+# the first one imports everything the CLI used to import at startup
+STARTUP_COMMANDS = (("eager imports", ["-c", "import text_stego, crawler, cover_cache, art, colorama"]),
+                    ("cli --help", ["kagenokotoba.py", "--help"]),
+                    ("cli unhide --help", ["kagenokotoba.py", "unhide", "--help"]),
+                    ("cli batch --help", ["kagenokotoba.py", "batch", "--help"]))
+
+def synthetic_cover(path, n_words = 5000, seed = 0):
+    """ Write a random cover text with n_words words into path """
+    rnd = random.Random(seed)
+    words = []
+    while len(words) < n_words:
+        word = "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(2, 9)))
+        words.append(word)
+
+    with open(path, "w") as f:
+        f.write(" ".join(words))
+
+
+def synthetic_payload(path, size, seed = 0):
+    """ Write size random bytes into path """
+    rnd = np.random.RandomState(seed)
+    rnd.randint(0, 256, size, dtype = "uint8").tofile(path)
+
+
+def synthetic_image(path, width, height, seed = 0):
+    """ Write a random RGB PNG of width x height pixels into path """
+    rnd = np.random.RandomState(seed)
+    Image.fromarray(rnd.randint(0, 256, (height, width, 3), dtype = "uint8"), "RGB").save(path, "PNG")
+
+
+def image_side(key_length):
+    """ Side of the smallest square RGB image where a key fits with 1 LSB """
+    return max(1, math.ceil(math.sqrt(math.ceil(key_length * 3))))
+
+
+def peak_rss_kb():
+    """ Peak resident memory of this process in KB, None where not available """
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(function, repeat = 3):
+    """
+    Time a function and trace its allocations, the traced
+    run is apart so it does not slow down the timed ones.
+
+    :return: float with the best seconds and int with the peak of allocated bytes
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def run_case(stage, size, workdir, options):
+    """
+    Prepare the inputs of a stage for a payload size and
+    measure it, meant to run in its own process so the peak
+    RSS belongs to this case only.
+
+    :param stage: one of STAGES.
+    :param size: int with the payload bytes.
+    :param workdir: directory for the synthetic files.
+    :param options: dict with cover_words, image_size and repeat.
+    :return: dict with the measures, "skipped" is set when the case does not fit.
+    """
+    cover = os.path.join(workdir, "cover.txt")
+    payload = os.path.join(workdir, "payload_%d.bin" % (size))
+    cover_image = os.path.join(workdir, "cover_%d.png" % (size))
+    stego_image = os.path.join(workdir, "stego_%d.png" % (size))
+
+    result = {"stage": stage, "payload_bytes": size}
+
+    if stage == "text_hide":
+        ph = stego.ParagraphsHiding(cover, file_to_hide=payload)
+        function = ph.hide_information
+    else:
+        key = stego.ParagraphsHiding(cover, file_to_hide=payload).hide_information()
+
+    if stage == "text_unhide":
+        uh = stego.ParagraphsHiding(cover, key=key, file_to_unhide=payload + "_unhide")
+        function = uh.unhide_information
+
+    if stage in ("image_embed", "image_extract"):
+        width, height = options["image_size"] or (image_side(len(key)),) * 2
+        if width * height > options["max_image_pixels"] or width * height * 3 < len(key) * 9:
+            result["skipped"] = "key of %d characters does not fit in %dx%d image" % (len(key), width, height)
+            return result
+        synthetic_image(cover_image, width, height)
+        result["image_pixels"] = width * height
+
+        if stage == "image_embed":
+            ih = stego.ImageHiding(cover_image, key_to_hide=key, url_metadata="corpus:bench", url_language="en")
+            function = lambda: ih.hide_information(stego_image)
+        else:
+            stego.ImageHiding(cover_image, key_to_hide=key).hide_information(stego_image)
+            function = lambda: stego.ImageHiding(stego_image).unhide_information()
+
+    seconds, peak_alloc = measure(function, options["repeat"])
+    result.update(seconds=seconds, mb_per_s=size / seconds / 1e6, peak_alloc_bytes=peak_alloc,
+                  peak_rss_kb=peak_rss_kb())
+
+    return result
+
+
+def run_suite(sizes, stages = STAGES, cover_words = 5000, image_size = None, max_image_pixels = 64 * 1024 ** 2,
+              repeat = 3):
+    """
+    Run every stage for every payload size, each case in a
+    new process.
+
+    :param sizes: list with payload sizes in bytes.
+    :param stages: optional, stages to run.
+    :param cover_words: optional, words of the synthetic cover text.
+    :param image_size: optional, (width, height) of the cover images, the smallest fitting the key by default.
+    :param max_image_pixels: optional, image cases above this size are skipped.
+    :param repeat: optional, timed runs of every case, the best one is kept.
+    :return: list with a result dict per case.
+    """
+    options = {"image_size": image_size, "max_image_pixels": max_image_pixels, "repeat": repeat}
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        synthetic_cover(os.path.join(workdir, "cover.txt"), cover_words)
+
+        for size in sizes:
+            synthetic_payload(os.path.join(workdir, "payload_%d.bin" % (size)), size)
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results.append(executor.submit(run_case, stage, size, workdir, options).result())
+
+    return results
+
+
+def synthetic_page(language, paragraphs = 400, seed = 0):
+    """
+    Build a page with the structure of the cover pages of
+    a language, the cover div sits in the middle of the page
+    with as much markup before and after it.
+
+    :return: str with the html
+    """
+    rnd = random.Random(seed)
+
+    def paragraph():
+        return " ".join("".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(2, 9)))
+                        for _ in range(60))
+
+    def filler():
+        return "".join('<div class="nav"><ul><li><a href="/n%d">%s</a></li></ul><p>%s</p></div>'
+                       % (i, paragraph()[:20], paragraph()) for i in range(paragraphs))
+
+    body = "".join("<p>%s <b>%s</b></p><script>var x = %d;</script>" % (paragraph(), paragraph()[:30], i)
+                   for i in range(paragraphs))
+    if language == "es":
+        cover = ('<div class="imagen-post"><img class="new-featured-image" data-src="/cover.png"></div>'
+                 '<div class="alm-nextpage">%s</div>' % (body))
+    elif language == "en":
+        cover = '<div id="mw-content-text"><img src="//cover.png">%s</div>' % (body)
+    else:
+        cover = '<img class="g-picture" src="/cover.png"><div class="b-text">%s</div>' % (body)
+
+    return "<html><head><title>t</title></head><body>%s%s%s</body></html>" % (filler(), cover, filler())
+
+
+def bench_parse(pages, repeat = 3):
+    """
+    Time the extraction of cover text and image with every
+    available extractor backend.
+
+    :param pages: list with (language, html) tuples.
+    :return: list with (backend, cpu seconds per page, peak bytes) tuples.
+    """
+    backends = ["soup", "stream"] + (["lxml"] if extractors.lxml is not None else [])
+    results = []
+
+    for backend in backends:
+        extractor = extractors.get_extractor(backend)
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.process_time()
+            for language, html in pages:
+                get_cover_source(language).parse_source(extractor, html, "http://localhost/")
+            best = min(best, time.process_time() - start)
+
+        tracemalloc.start()
+        for language, html in pages:
+            get_cover_source(language).parse_source(extractor, html, "http://localhost/")
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results.append((backend, best / len(pages), peak))
+
+    return results
+
+
+def main_parse(files):
+    """ Benchmark of the extractors over saved pages, given as language:path """
+    if files:
+        pages = []
+        for spec in files:
+            language, path = spec.split(":", 1)
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages.append((language, f.read()))
+    else:
+        pages = [(language, synthetic_page(language)) for language in ("es", "en", "ru")]
+
+    print("%8s %16s %16s" % ("backend", "cpu ms/page", "peak KB"))
+    for backend, seconds, peak in bench_parse(pages):
+        print("%8s %16.2f %16d" % (backend, seconds * 1e3, peak // 1024))
+
+
+def bench_startup(commands = STARTUP_COMMANDS, repeat = 10, top = 5):
+    """
+    Time the start of new interpreters running the given
+    commands, and get their imports with -X importtime.
+
+    :param commands: optional, list with (label, python arguments) tuples.
+    :param repeat: optional, runs of every command, the best one is kept.
+    :param top: optional, number of the slowest top level imports to report.
+    :return: list with a result dict per command.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = []
+
+    for label, argv in commands:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            best = min(best, time.perf_counter() - start)
+
+        report = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=cwd, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, universal_newlines=True).stderr
+
+        # lines are "import time: self | cumulative | name", nested imports are indented
+        imports = []
+        for line in report.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            imports.append((name.rstrip(), int(self_us), int(cumulative_us)))
+
+        top_level = sorted(((name.strip(), cumulative) for name, _, cumulative in imports
+                            if name == " " + name.strip()), key=lambda item: -item[1])
+        results.append({"command": label, "seconds": best, "import_seconds": sum(i[1] for i in imports) / 1e6,
+                        "modules": len(imports), "top_imports": top_level[:top]})
+
+    return results
+
+
+def main_startup(args):
+    """ Benchmark of the start of the CLI """
+    results = bench_startup(repeat=args.repeat)
+
+    table = sys.stderr if args.json == "-" else sys.stdout
+    print("%20s %10s %12s %8s  %s" % ("command", "wall ms", "imports ms", "modules", "slowest imports"), file=table)
+    for result in results:
+        print("%20s %10.1f %12.1f %8d  %s" % (result["command"], result["seconds"] * 1e3,
+                                              result["import_seconds"] * 1e3, result["modules"],
+                                              ", ".join("%s %.0fms" % (name, us / 1e3)
+                                                        for name, us in result["top_imports"][:3])), file=table)
+
+    if args.json is not None:
+        write_report(args, {"startup": results})
+
+
+def write_report(args, report):
+    """ Write a JSON report with the data of the run """
+    report.update(label=args.label, time=time.time(), python=platform.python_version(), numpy=np.__version__,
+                  platform=platform.platform())
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def parse_size(text):
+    """ Size in bytes from a number with an optional K, M or G suffix """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1:].upper()])
+
+    return int(text)
+
+
+def main(args):
+    results = run_suite(args.sizes or DEFAULT_SIZES, args.stages.split(","), args.cover_words,
+                        args.image_size and tuple(int(side) for side in args.image_size.lower().split("x")),
+                        args.max_image_pixels, args.repeat)
+
+    # the table goes aside when stdout has the JSON report
+    table = sys.stderr if args.json == "-" else sys.stdout
+    print("%14s %12s %12s %12s %14s" % ("stage", "bytes", "MB/s", "peak RSS KB", "peak alloc KB"), file=table)
+    for result in results:
+        if "skipped" in result:
+            print("%14s %12d %12s" % (result["stage"], result["payload_bytes"], "skipped"), file=table)
+            continue
+        print("%14s %12d %12.2f %12s %14d" % (result["stage"], result["payload_bytes"], result["mb_per_s"],
+                                              result["peak_rss_kb"], result["peak_alloc_bytes"] // 1024), file=table)
+
+    if args.json is not None:
+        write_report(args, {"cover_words": args.cover_words, "results": results})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmark for the stego algorithms")
+    parser.add_argument("sizes", nargs="*", type=parse_size, help="payload sizes in bytes, K, M and G suffixes allowed")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated stages to run")
+    parser.add_argument("--cover-words", type=int, default=5000, help="words of the synthetic cover text")
+    parser.add_argument("--image-size", default=None, metavar="WxH",
+                        help="size of the synthetic cover images, the smallest fitting the key by default")
+    parser.add_argument("--max-image-pixels", type=int, default=64 * 1024 ** 2,
+                        help="image cases with bigger images are skipped")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of every case, the best one is kept")
+    parser.add_argument("--json", default=None, metavar="FILE", help="write the results as JSON, - for stdout")
+    parser.add_argument("--label", default="", help="name of the run in the JSON report, like a version")
+    parser.add_argument("--parse", nargs="*", metavar="LANG:FILE",
+                        help="benchmark the html extractors on saved pages, synthetic ones if none given")
+    parser.add_argument("--startup", action="store_true", help="benchmark the start time of the CLI")
+    args = parser.parse_args()
+
+    if args.parse is not None:
+        main_parse(args.parse)
+    elif args.startup:
+        main_startup(args)
+    else:
+        main(args)
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: corpus.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Offline corpus of covers indexed ahead of time """
+
+import os, json, random, bisect
+from PIL import Image
+
+from cover_index import CoverIndex, atomic_file
+import text_stego as stego
+import instrumentation
+
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "kagenokotoba", "corpus")
+
+IMAGE_EXTENSIONS = (".png", ".bmp", ".tif", ".tiff")
+
+INDEX_DIR = ".index"
+DOCUMENTS_FILE = "documents.json"
+
+
+class Corpus():
+    """
+    Directory of <id>.txt texts with an optional image of the
+    same name. The index keeps, for every document, the word
+    count and image size, and the clean words arrays of every
+    text in a CoverIndex, so covers are chosen in O(1) and
+    their words are not cleaned again.
+    """
+
+    def __init__(self, corpus_dir = DEFAULT_CORPUS_DIR, rebuild = False):
+        """
+        Constructor of the class Corpus, the index is
+        built when the directory was not indexed yet.
+
+        :param corpus_dir: optional, directory with the documents.
+        :param rebuild: optional, index the directory again even if it was indexed.
+        """
+        self.corpus_dir = corpus_dir
+        self.index_dir = os.path.join(corpus_dir, INDEX_DIR)
+        self.cover_index = CoverIndex(self.index_dir)
+
+        self.documents = None
+        if not rebuild:
+            try:
+                with open(os.path.join(self.index_dir, DOCUMENTS_FILE), "r") as f:
+                    self.documents = json.load(f)
+            except FileNotFoundError:
+                pass
+        if self.documents is None:
+            self.documents = self.build()
+
+        self._by_id = {document["id"]: document for document in self.documents}
+        # sorted by size, the documents with enough pixels are always a suffix
+        self._with_image = sorted((document for document in self.documents if document["image"] is not None),
+                                  key=lambda document: document["width"] * document["height"])
+        self._pixels = [document["width"] * document["height"] for document in self._with_image]
+
+    def build(self):
+        """
+        Index every document of the corpus directory.
+
+        :return: list with a dict per document.
+        """
+        files = set(os.listdir(self.corpus_dir))
+        documents = []
+
+        for f_name in sorted(files):
+            doc_id, extension = os.path.splitext(f_name)
+            if extension != ".txt":
+                continue
+
+            with open(os.path.join(self.corpus_dir, f_name), "r", encoding="utf-8") as f:
+                text = f.read()
+            # cleans the words and stores them in the cover index
+            ph = stego.ParagraphsHiding(text_where_to_hide=text, cover_index=self.cover_index)
+
+            document = {"id": doc_id, "text": f_name, "hash": self.cover_index.text_hash(text),
+                        "words": ph.words_count, "image": None, "width": 0, "height": 0, "mode": None}
+
+            for image_extension in IMAGE_EXTENSIONS:
+                if doc_id + image_extension in files:
+                    with Image.open(os.path.join(self.corpus_dir, doc_id + image_extension)) as image:
+                        document.update(image=doc_id + image_extension, width=image.size[0],
+                                        height=image.size[1], mode=image.mode)
+                    break
+
+            documents.append(document)
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        with atomic_file(os.path.join(self.index_dir, DOCUMENTS_FILE)) as f:
+            f.write(json.dumps(documents).encode("utf-8"))
+
+        return documents
+
+    def document(self, doc_id):
+        """ Index entry of a document, KeyError if it is not in the corpus """
+        return self._by_id[doc_id]
+
+    def random_document(self, rnd = random, min_pixels = 0):
+        """
+        Choose a document with image where to hide information.
+        The word count is not filtered here, it is left to the
+        capacity check of the chosen cover.
+
+        :param rnd: optional, random.Random to make the choice reproducible.
+        :param min_pixels: optional, minimum pixels of the image.
+        :return: dict with the index entry of the document.
+        """
+        first = bisect.bisect_left(self._pixels, min_pixels)
+        if first == len(self._with_image):
+            raise ValueError("%s: no documents with image of %d pixels in the corpus"
+                             % (self.corpus_dir, min_pixels))
+
+        return self._with_image[first + rnd.randrange(len(self._with_image) - first)]
+
+    def read_text(self, document):
+        with open(os.path.join(self.corpus_dir, document["text"]), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def read_image(self, document):
+        if document["image"] is None:
+            raise ValueError("%s: document without image" % (document["id"]))
+
+        with instrumentation.stage("image_decode"):
+            image = Image.open(os.path.join(self.corpus_dir, document["image"]))
+            image.load()
+        return image
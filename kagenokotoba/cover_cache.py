@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: cover_cache.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Local cache of the cover texts fetched to unhide information """
+
+import os, json, time
+
+from cover_index import CoverIndex, atomic_file
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kagenokotoba", "texts")
+
+text_hash = CoverIndex.text_hash
+
+
+def _write_atomic(path, data):
+    """ Write the file aside and rename it, readers never see half written files """
+    with atomic_file(path) as file_:
+        file_.write(data)
+
+
+class CoverCache():
+    """
+    Directory of cover texts stored by the hash of their
+    content, with an index from the page urls to the hashes.
+    Texts are verified against their hash when read and the
+    least recently used ones are evicted above max_bytes.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir = DEFAULT_CACHE_DIR, max_bytes = 64 * 1024 * 1024):
+        """
+        Constructor of the class CoverCache.
+
+        :param cache_dir: optional, directory where to keep the texts.
+        :param max_bytes: optional, maximum size of the stored texts.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, content_hash):
+        return os.path.join(self.cache_dir, "%s.txt" % (content_hash))
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        os.makedirs(self.cache_dir, exist_ok = True)
+        _write_atomic(os.path.join(self.cache_dir, self.INDEX_FILE), json.dumps(index).encode("utf-8"))
+
+    def _read(self, content_hash):
+        """ Text stored with the given hash, None if missing or corrupted, corrupted files are removed """
+        try:
+            with open(self._path(content_hash), "rb") as f:
+                text = f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except UnicodeDecodeError:
+            text = None
+
+        if text is None or text_hash(text) != content_hash:
+            try:
+                os.remove(self._path(content_hash))
+            except FileNotFoundError:
+                pass
+            return None
+
+        return text
+
+    def get(self, url, content_hash = ''):
+        """
+        Get a cover text from the cache.
+
+        :param url: str with the url of the cover page.
+        :param content_hash: optional, expected hash of the text, recorded when hiding.
+        :return: str with the text, None if not cached or not matching the expected hash.
+        """
+        index = self._load_index()
+        entry = index.get(url)
+
+        # texts are looked up by content, the url only gives the hash when it is not known
+        if content_hash == '':
+            if entry is None:
+                return None
+            content_hash = entry["hash"]
+
+        text = self._read(content_hash)
+        if text is None:
+            if url in index and index[url]["hash"] == content_hash:
+                del index[url]
+                self._save_index(index)
+            return None
+
+        index[url] = {"hash": content_hash, "size": len(text.encode("utf-8")), "atime": time.time()}
+        self._save_index(index)
+
+        return text
+
+    def put(self, url, text):
+        """
+        Store the text of a cover page.
+
+        :param url: str with the url of the cover page.
+        :param text: str with the cover text.
+        :return: str with the hash of the text.
+        """
+        content_hash = text_hash(text)
+        data = text.encode("utf-8")
+
+        os.makedirs(self.cache_dir, exist_ok = True)
+        # written again when the stored copy does not verify
+        if self._read(content_hash) is None:
+            _write_atomic(self._path(content_hash), data)
+
+        index = self._load_index()
+        index[url] = {"hash": content_hash, "size": len(data), "atime": time.time()}
+        self._evict(index)
+        self._save_index(index)
+
+        return content_hash
+
+    def _evict(self, index):
+        """ Remove the least recently used texts until the cache fits in max_bytes """
+        sizes = {}
+        last_access = {}
+        for entry in index.values():
+            sizes[entry["hash"]] = entry["size"]
+            last_access[entry["hash"]] = max(entry["atime"], last_access.get(entry["hash"], 0))
+
+        total = sum(sizes.values())
+        for content_hash in sorted(last_access, key = last_access.get):
+            if total <= self.max_bytes:
+                break
+
+            total -= sizes[content_hash]
+            for url in [url for url, entry in index.items() if entry["hash"] == content_hash]:
+                del index[url]
+            try:
+                os.remove(self._path(content_hash))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: cover_index.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Persistent index of the words of the cover texts """
+
+import os, hashlib, tempfile, contextlib
+import numpy as np
+
+
+# change it when the way of cleaning the words changes
+INDEX_VERSION = 1
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kagenokotoba", "covers")
+
+
+@contextlib.contextmanager
+def atomic_file(path):
+    """
+    Binary file written aside and renamed to path once closed,
+    readers never see half written files and nothing is left
+    behind when writing fails.
+
+    :param path: str with the final path of the file.
+    :return: context manager giving the file object to write.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(path), suffix = ".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file_:
+            yield file_
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class CoverIndex():
+    """
+    Directory of binary files, one per cover text, keyed by
+    the hash of the text. Every file is an (2, words) uint32
+    array with the first and the last letters of the clean
+    words of the text.
+    """
+
+    def __init__(self, index_dir = DEFAULT_INDEX_DIR):
+        """
+        Constructor of the class CoverIndex.
+
+        :param index_dir: optional, directory where to keep the indexes.
+        """
+        self.index_dir = index_dir
+
+    @staticmethod
+    def text_hash(text):
+        """
+        Get the key of a cover text in the index.
+
+        :param text: str with the cover text.
+        :return: str with the hex digest of the text.
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path(self, text_hash):
+        """ Path of the index file of the given text hash """
+        return os.path.join(self.index_dir, "%s.v%d.npy" % (text_hash, INDEX_VERSION))
+
+    def load(self, text_hash):
+        """
+        Memory-map the index of a cover text.
+
+        :param text_hash: str with the hash of the cover text.
+        :return: tuple with first and last letters arrays, None if not indexed.
+        """
+        try:
+            letters = np.load(self.path(text_hash), mmap_mode = "r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if letters.ndim != 2 or letters.shape[0] != 2 or letters.dtype != np.uint32:
+            return None
+
+        return letters[0], letters[1]
+
+    def store(self, text_hash, first_letters, last_letters):
+        """
+        Save the index of a cover text, the file is written
+        aside and renamed so concurrent processes never read
+        a half written index.
+
+        :param text_hash: str with the hash of the cover text.
+        :param first_letters: numpy array with the first letters of the words.
+        :param last_letters: numpy array with the last letters of the words.
+        """
+        os.makedirs(self.index_dir, exist_ok = True)
+
+        with atomic_file(self.path(text_hash)) as file_:
+            np.save(file_, np.stack((first_letters, last_letters)).astype("uint32"))
@@ -15,159 +15,269 @@ File: crawler.py
 
 """ Crawler utility to recover cover text, cover image and URL """
 
-import requests, random
-from urllib.request import Request, urlopen
-from bs4 import BeautifulSoup
+import random
+from urllib.parse import urljoin
+from extractors import ExtractionError, get_extractor
+from corpus import Corpus, DEFAULT_CORPUS_DIR
+import instrumentation
 from PIL import Image
 from io import BytesIO
 
 
+class Cover():
+    """ Text, image and origin of a cover, kept in memory """
+
+    def __init__(self, url, language, text, image, cover_index = None):
+        """
+        Constructor of the class Cover.
+
+        :param url: str with the url of the source page.
+        :param language: str with the language of the source.
+        :param text: str with the cover text.
+        :param image: PIL image already decoded, None when only the text was fetched.
+        :param cover_index: optional, CoverIndex with the words of the text already indexed.
+        """
+        self.url = url
+        self.language = language
+        self.text = text
+        self.image = image
+        self.cover_index = cover_index
+
+    def save(self, text_file = "cover.txt", image_file = "cover.png"):
+        """ Write the cover into files, for tools that still work with paths """
+        with open(text_file, "w") as f:
+            f.write(self.text)
+        self.image.save(image_file, "PNG")
+
+
+class CoverSource():
+    """
+    Cover source plugin, declares where the covers of a
+    language are and how to extract them. With a corpus
+    directory the covers are served from local files instead.
+    """
+
+    # scheme of the urls of covers served from a corpus
+    CORPUS_SCHEME = "corpus:"
+
+    def __init__(self, language, listing_url, selectors, encoding = None, corpus_dir = None):
+        """
+        Constructor of the class CoverSource.
+
+        :param language: str with the language of the covers, key of the registry.
+        :param listing_url: str with the url of the page listing the cover pages.
+        :param selectors: dict with the "text", "image" and "links" selectors (see extractors).
+        :param encoding: optional, encoding of the pages when the server does not send it.
+        :param corpus_dir: optional, directory with <id>.txt texts and their images (see corpus).
+        """
+        self.language = language
+        self.listing_url = listing_url
+        self.selectors = selectors
+        self.encoding = encoding
+        self.corpus_dir = corpus_dir
+        self._corpus = None
+
+    @property
+    def corpus(self):
+        """ Index of the corpus directory, loaded on first use """
+        if self._corpus is None or self._corpus.corpus_dir != self.corpus_dir:
+            if self.corpus_dir is None:
+                raise ExtractionError("no corpus directory for language %s" % (self.language))
+            self._corpus = Corpus(self.corpus_dir)
+
+        return self._corpus
+
+    def random_cover(self, finder, fetch_image = True, min_pixels = 0):
+        """
+        Locate a random cover, from the corpus when there is one.
+        The minimum only filters corpus covers, web pages are not
+        known until they are fetched.
+        """
+        if self.corpus_dir is not None:
+            try:
+                document = self.corpus.random_document(min_pixels=min_pixels)
+            except ValueError as exc:
+                raise ExtractionError(str(exc))
+            return self.get_cover(finder, self.CORPUS_SCHEME + document["id"], fetch_image)
+
+        url = random.choice(self.parse_listing(finder.extractor, finder._fetch(self.listing_url, self.encoding),
+                                               self.listing_url))
+        return self.get_cover(finder, url, fetch_image)
+
+    def get_cover(self, finder, url, fetch_image = True):
+        """ Locate the text and the image of a cover, the image is skipped without fetch_image """
+        if url.startswith(self.CORPUS_SCHEME):
+            return self.get_corpus_cover(url, fetch_image)
+
+        text, image_link = self.parse_source(finder.extractor, finder._fetch(url, self.encoding), url)
+
+        return Cover(url, self.language, text, finder._get_image(image_link) if fetch_image else None)
+
+    def get_corpus_cover(self, url, fetch_image = True):
+        """ Read a cover of the corpus directory, the url holds the document id """
+        corpus = self.corpus
+        try:
+            document = corpus.document(url[len(self.CORPUS_SCHEME):])
+        except KeyError:
+            raise ExtractionError("%s: document not found in corpus %s" % (url, self.corpus_dir))
+
+        return Cover(url, self.language, corpus.read_text(document),
+                     corpus.read_image(document) if fetch_image else None, corpus.cover_index)
+
+    def parse_source(self, extractor, html, url):
+        """
+        Extract text and image link from a cover page.
+
+        :return: str with the text and str with the absolute image link
+        """
+        with instrumentation.stage("parse"):
+            found = extractor.extract(html, {"text": self.selectors["text"], "image": self.selectors["image"]})
+
+        if found["text"] is None or found["text"] == [] or found["image"] is None:
+            raise ExtractionError("%s: cover text or image not found" % (url))
+
+        text = found["text"]
+        if isinstance(text, list):
+            text = "".join(text)
+
+        return text, urljoin(url, found["image"])
+
+    def parse_listing(self, extractor, html, url):
+        """
+        Extract the links to the cover pages from a listing page.
+
+        :return: list with the absolute links
+        """
+        with instrumentation.stage("parse"):
+            links = extractor.extract(html, {"links": self.selectors["links"]})["links"]
+        if not links:
+            raise ExtractionError("%s: no links found" % (url))
+
+        return [urljoin(url, link) for link in links]
+
+
+# registry of the cover sources by language
+SOURCES = {}
+
+
+def register_source(source):
+    """ Add a cover source plugin, replacing the one of its language """
+    SOURCES[source.language] = source
+
+
+def get_cover_source(language):
+    """
+    Get the cover source plugin of a language.
+
+    :return: CoverSource
+    """
+    try:
+        return SOURCES[language]
+    except KeyError:
+        raise ValueError("no cover source for language %s" % (language))
+
+
+register_source(CoverSource(
+    "es", "https://www.pequeocio.com/cuentos-infantiles/cuentos-clasicos/",
+    {"text": {"within": [("div", {"class": "alm-nextpage"})], "extract": "text"},
+     "image": {"within": [("div", {"class": "imagen-post"})],
+               "target": ("img", {"class": "new-featured-image"}), "extract": "data-src"},
+     "links": {"within": [("section", {"class": "card-module"})],
+               "each": ("div", {"class": "card-information"}), "target": ("a", {}), "extract": "href"}}))
+
+register_source(CoverSource(
+    "en", "https://en.wikipedia.org/wiki/List_of_The_Simpsons_characters",
+    {"text": {"within": [("div", {"id": "mw-content-text"})], "extract": "text"},
+     "image": {"within": [("div", {"id": "mw-content-text"})], "target": ("img", {}), "extract": "src"},
+     "links": {"within": [("table", {"class": "wikitable"})],
+               "each": ("tr", {}), "skip": 3, "target": ("a", {}), "extract": "href"}}))
+
+# russian pages are not served with their charset
+register_source(CoverSource(
+    "ru", "https://lenta.ru/rubrics/world/politic/",
+    {"text": {"within": [("div", {"class": "b-text"})], "each": ("p", {}), "extract": "text"},
+     "image": {"target": ("img", {"class": "g-picture"}), "extract": "src"},
+     "links": {"within": [("div", {"class": "news-list"})],
+               "each": ("div", {"class": "news"}), "target": ("a", {}), "extract": "href"}},
+    encoding="utf-8"))
+
+# offline covers, the language of the documents is the one of the corpus
+register_source(CoverSource("corpus", None, {}, corpus_dir=DEFAULT_CORPUS_DIR))
+
+
 class SourceFinding():
     """ Source Text and Image crawler """
-    _SESSION = requests.session()
+    # created on the first request, corpus covers never need requests
+    _SESSION = None
     _HEADERS = {"User-Agent":"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/42.0.2311.135 Safari/537.36 Edge/12.246",
                     "Accept":"text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
                     "Accept-language":"en;q=0.5,ru;q=0.3",
                     "Accept-Encoding":"gzip, deflate, br"}
 
-    def __init__(self, source_url = '', source_language = ''):
+    def __init__(self, source_url = '', source_language = '', extractor = None):
+        """
+        Constructor of the class SourceFinding.
+
+        :param source_url: optional, url of the page to use as cover.
+        :param source_language: optional, language of the source, key of the sources registry.
+        :param extractor: optional, extractors backend name, the fastest available by default.
+        """
         self.source_url = source_url
         self.source_language = source_language
+        self.extractor = get_extractor(extractor)
 
-    def generate(self):
+    def generate(self, fetch_image = True, min_pixels = 0):
         """
         Main function from the class to extract
         the text to hide information.
 
-        :return: str with the text where to hide information
-        :return: str of source language
+        :param fetch_image: optional, download also the cover image.
+        :param min_pixels: optional, minimum pixels of the image of random corpus covers.
+        :return: Cover with the text and image where to hide information, None without language
         """
-        if self.source_language != '':
-            if self.source_language == "es":
-                if self.source_url != '':
-                    return self.get_source_es(self.source_url)
-                else:
-                    return self.random_source_es(), "es"
-            elif self.source_language == "en":
-                if self.source_url != '':
-                    return self.get_source_en(self.source_url)
-                else:
-                    return self.random_source_en(), "en"
-            else:
-                if self.source_url != '':
-                    return self.get_source_ru(self.source_url)
-                else:
-                    return self.random_source_ru(), "ru"
-
-        return None, None
-
-
-    def get_source_es(self, tale_url):
-        """ Locate a text and an image from a spanish website """
-        req = self._SESSION.get(tale_url, headers=self._HEADERS)
-        bsObj = BeautifulSoup(req.text, "html.parser")
-        text = bsObj.find("div", {"class","alm-nextpage"}).get_text()
-        image_link = bsObj.find("div", {"class":"imagen-post"}).find("img", {"class":"new-featured-image"})["data-src"]
-
-        self._get_text(text)
-        self._get_image(image_link)
-
-
-    def random_source_es(self):
-        """ Locate information from a spanish webpage through a random book """
-        tales_list = []
-        url = "https://www.pequeocio.com/cuentos-infantiles/cuentos-clasicos/"
-
-        req = self._SESSION.get(url, headers=self._HEADERS)
-        bsObj = BeautifulSoup(req.text, "html.parser")
-        tales_links = bsObj.find("section", {"class","card-module"}).findAll("div", {"class","card-information"})
-        for tale_link in tales_links:
-            tales_list.append(tale_link.find("a")["href"])
-
-        random_tale_url = random.choice(tales_list)
-        self.get_source_es(random_tale_url)
-
-        return random_tale_url
-
-    def get_source_en(self, character_url):
-        """ Locate a text and an image from an english website """
-        req = self._SESSION.get(character_url, headers=self._HEADERS)
-        bsObj = BeautifulSoup(req.text, "html.parser")
-        text = bsObj.find("div", {"id":"mw-content-text"}).get_text()
-        image_link = bsObj.find("div", {"id":"mw-content-text"}).find("img")["src"]
-        image_link = "http:"+image_link
-
-        self._get_text(text)
-        self._get_image(image_link)
-
-
-    def random_source_en(self):
-        """ Locate information from an english webpage through a random simpson character """
-        characters_list = []
-        url = "https://en.wikipedia.org/wiki/List_of_The_Simpsons_characters"
-
-        req = self._SESSION.get(url, headers=self._HEADERS)
-        bsObj = BeautifulSoup(req.text, "html.parser")
-        rows = bsObj.find("table", {"class","wikitable"}).findAll("tr")[3:]
-        for row in rows:
-            if row.find("a"):
-                characters_list.append(row.find("a")['href'])
-
-        random_character_url = "https://en.wikipedia.org"+random.choice(characters_list)
-        self.get_source_en(random_character_url)
-
-        return random_character_url
-
-    def get_source_ru(self, random_new):
-        """ Locate a text and an image from a russian website """
-        req = urlopen(random_new)
-        response = str(req.read(), 'utf-8')
-        bsObj = BeautifulSoup(response, "html.parser")
-        text = bsObj.find("div", {"class":"b-text"}).findAll("p")
-        text_new = ''
-        for item in text:
-            text_new += item.get_text()
-        image_link = bsObj.find("img", {"class":"g-picture"})["src"]
-
-        self._get_text(text_new)
-        self._get_image(image_link)
-
-
-    def random_source_ru(self):
-        """ Locate information from a russian webpage through a random post """
-        news_list = []
-        url = "https://lenta.ru/rubrics/world/politic/"
-        req = urlopen(url)
-        response = str(req.read(), 'utf-8')
-        bsObj = BeautifulSoup(response, "html.parser")
-        rows = bsObj.find("div", {"class":"news-list"}).findAll("div", {"class":"news"})
-
-        for row in rows:
-            if row.find("a"):
-                news_list.append(row.find("a")['href'])
-
-        random_new_url = "https://lenta.ru"+random.choice(news_list)
-        self.get_source_ru(random_new_url)
-
-        return random_new_url
+        if self.source_language == '':
+            return None
+
+        source = get_cover_source(self.source_language)
+        if self.source_url != '':
+            return source.get_cover(self, self.source_url, fetch_image)
 
-    def _get_text(self, text):
-        with open("cover.txt", "w") as f:
-            f.write(text)
+        return source.random_cover(self, fetch_image, min_pixels)
 
-        f.close()
+    @classmethod
+    def _session(cls):
+        """ Session shared by every request of the process """
+        if cls._SESSION is None:
+            import requests
+            cls._SESSION = requests.session()
+
+        return cls._SESSION
+
+    def _fetch(self, url, encoding = None):
+        """ Get the html of a page through the shared session """
+        with instrumentation.stage("crawl"):
+            req = self._session().get(url, headers=self._HEADERS)
+        instrumentation.count("crawled_bytes", len(req.content))
+        if encoding is not None:
+            req.encoding = encoding
+
+        return req.text
 
     def _get_image(self, image_link):
-        req = self._SESSION.get(image_link, headers=self._HEADERS)
+        """ Download and decode the cover image """
+        with instrumentation.stage("crawl"):
+            req = self._session().get(image_link, headers=self._HEADERS)
+        instrumentation.count("crawled_bytes", len(req.content))
 
-        _tmp_image = Image.open(BytesIO(req.content))
-        _tmp_image.save("cover.png", "PNG")
+        with instrumentation.stage("image_decode"):
+            _tmp_image = Image.open(BytesIO(req.content))
+            _tmp_image.load()
+
+        return _tmp_image
 
 
 if __name__ == "__main__":
     '''
-    source = SourceFinding(None)
-
     command = input("""
     Language of the sources ?
 
@@ -176,12 +286,6 @@ if __name__ == "__main__":
     [ru]ssian
 
     """)
-    if command == "es":
-        metadata = source.random_source_es()
-        print(metadata)
-    elif command == "en":
-        metadata = source.random_source_en()
-        print(metadata)
-    else:
-        source.random_source_ru()
+    cover = SourceFinding(source_language=command).generate()
+    print(cover.url)
     '''
\ No newline at end of file
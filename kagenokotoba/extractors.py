@@ -0,0 +1,402 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: extractors.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Extraction of cover text, image and links from html pages """
+
+import abc
+from html.parser import HTMLParser
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+
+# elements that never have content nor end tag
+VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input",
+                       "link", "meta", "param", "source", "track", "wbr"))
+
+# elements whose content is not part of the text of a page
+SKIP_TEXT_TAGS = frozenset(("script", "style"))
+
+
+class ExtractionError(Exception):
+    """ Page without the elements declared in a selector """
+    pass
+
+
+# A selector is a dict declaring where a value is in a page:
+#
+#   within:  list of (tag, attrs), each one the first match inside the previous,
+#            the whole document if empty.
+#   each:    optional (tag, attrs), all the matches inside `within` give a value.
+#   skip:    optional, number of `each` matches to ignore.
+#   target:  optional (tag, attrs), first match inside `within` or every `each` match,
+#            the value comes from the matched element itself when not given.
+#   extract: "text" for the text of the element or the name of an attribute.
+#
+# Selectors without `each` give one value, those with `each` a list
+# of values. A "class" in attrs matches any of the element classes.
+
+
+def matches(step, tag, attrs):
+    """
+    Check if an element matches a selector step.
+
+    :param step: tuple with the tag and dict of attributes to match.
+    :param tag: str with the element tag.
+    :param attrs: dict with the element attributes.
+    :return: bool
+    """
+    step_tag, step_attrs = step
+    if tag != step_tag:
+        return False
+
+    for name, value in step_attrs.items():
+        if name == "class":
+            if value not in (attrs.get("class") or "").split():
+                return False
+        elif attrs.get(name) != value:
+            return False
+
+    return True
+
+
+class _SelectorMatch():
+    """ State of one selector along the events of the streaming parser """
+
+    def __init__(self, selector):
+        self.within = selector.get("within", [])
+        self.each = selector.get("each")
+        self.skip = selector.get("skip", 0)
+        self.target = selector.get("target")
+        self.extract = selector["extract"]
+
+        self.values = []
+        self.done = False
+
+        # depths of the open `within` elements, the last one is the container
+        self.within_depths = []
+        self.item_depth = None
+        self.items_seen = 0
+        self.item_taken = False
+        self.text_depth = None
+        self.text_parts = []
+
+    def _inside_container(self):
+        return len(self.within_depths) == len(self.within)
+
+    def _take(self, attrs, depth):
+        self.item_taken = True
+        if self.extract == "text":
+            self.text_depth = depth
+            self.text_parts = []
+            return
+
+        if self.extract in attrs:
+            self.values.append(attrs[self.extract])
+        if self.each is None:
+            self.done = True
+
+    def start(self, tag, attrs, depth):
+        if not self._inside_container():
+            if matches(self.within[len(self.within_depths)], tag, attrs):
+                self.within_depths.append(depth)
+                if self._inside_container() and self.each is None and self.target is None:
+                    self._take(attrs, depth)
+            return
+
+        if self.each is not None and self.item_depth is None:
+            if matches(self.each, tag, attrs):
+                self.items_seen += 1
+                if self.items_seen > self.skip:
+                    self.item_depth = depth
+                    self.item_taken = False
+                    if self.target is None:
+                        self._take(attrs, depth)
+            return
+
+        if self.target is not None and not self.item_taken and (self.each is None or self.item_depth is not None):
+            if matches(self.target, tag, attrs):
+                self._take(attrs, depth)
+
+    def data(self, text):
+        if self.text_depth is not None:
+            self.text_parts.append(text)
+
+    def end(self, depth):
+        if self.text_depth == depth:
+            self.values.append("".join(self.text_parts))
+            self.text_depth = None
+            if self.each is None:
+                self.done = True
+
+        if self.item_depth == depth:
+            self.item_depth = None
+
+        if self.within_depths and self.within_depths[-1] == depth:
+            # container closed, nothing else can match
+            self.done = True
+
+    def result(self):
+        if self.each is not None:
+            return self.values
+
+        return self.values[0] if self.values else None
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _StreamingParser(HTMLParser):
+    """ html.parser front-end feeding the selectors, stops when all of them are done """
+
+    def __init__(self, selectors):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.matches = [_SelectorMatch(selector) for selector in selectors]
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        depth = len(self.stack)
+        for match in self.matches:
+            if not match.done:
+                match.start(tag, attrs, depth)
+
+        if tag not in VOID_TAGS:
+            self.stack.append(tag)
+        self._check_done()
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS or tag not in self.stack:
+            return
+
+        # close every element left open inside the ended one
+        while True:
+            open_tag = self.stack.pop()
+            for match in self.matches:
+                if not match.done:
+                    match.end(len(self.stack))
+            if open_tag == tag:
+                break
+        self._check_done()
+
+    def handle_data(self, data):
+        if self.stack and self.stack[-1] in SKIP_TEXT_TAGS:
+            return
+
+        for match in self.matches:
+            if not match.done:
+                match.data(data)
+
+    def _check_done(self):
+        if all(match.done for match in self.matches):
+            raise _StopParsing()
+
+    def finish(self):
+        """ Close the elements still open at the end of the document """
+        while self.stack:
+            self.stack.pop()
+            for match in self.matches:
+                if not match.done:
+                    match.end(len(self.stack))
+
+
+class StreamingExtractor():
+    """ Incremental extractor over html.parser, no tree is built and parsing stops once everything is found """
+
+    name = "stream"
+
+    def extract(self, html, selectors):
+        """
+        Extract the values declared by some selectors.
+
+        :param html: str with the page.
+        :param selectors: dict name -> selector.
+        :return: dict name -> value (or list of values).
+        """
+        names = list(selectors)
+        parser = _StreamingParser([selectors[name] for name in names])
+        try:
+            parser.feed(html)
+            parser.close()
+            parser.finish()
+        except _StopParsing:
+            pass
+
+        return {name: match.result() for name, match in zip(names, parser.matches)}
+
+
+class _TreeExtractor(abc.ABC):
+    """ Selectors over a parsed tree, backends give the tree and how to walk it """
+
+    @abc.abstractmethod
+    def _find(self, element, step):
+        """ First descendant of element matching a (tag, attrs) step, None if there is none """
+
+    @abc.abstractmethod
+    def _find_all(self, element, step):
+        """ Descendants of element matching a (tag, attrs) step, in document order """
+
+    @abc.abstractmethod
+    def _text(self, element):
+        """ Text of element and its descendants, without scripts nor styles """
+
+    @abc.abstractmethod
+    def _attribute(self, element, name):
+        """ Value of an attribute of element, None if it has not got it """
+
+    def _value(self, element, selector):
+        if selector.get("target") is not None:
+            element = self._find(element, selector["target"])
+            if element is None:
+                return None
+
+        if selector["extract"] == "text":
+            return self._text(element)
+        return self._attribute(element, selector["extract"])
+
+    def _select(self, document, selector):
+        element = document
+        for step in selector.get("within", []):
+            element = self._find(element, step)
+            if element is None:
+                return [] if selector.get("each") is not None else None
+
+        if selector.get("each") is None:
+            return self._value(element, selector)
+
+        values = []
+        for item in self._find_all(element, selector["each"])[selector.get("skip", 0):]:
+            value = self._value(item, selector)
+            if value is not None:
+                values.append(value)
+        return values
+
+    @abc.abstractmethod
+    def _parse(self, html):
+        """ Root of the tree of a page """
+
+    def extract(self, html, selectors):
+        """
+        Extract the values declared by some selectors.
+
+        :param html: str with the page.
+        :param selectors: dict name -> selector.
+        :return: dict name -> value (or list of values).
+        """
+        document = self._parse(html)
+
+        return {name: self._select(document, selector) for name, selector in selectors.items()}
+
+
+class LxmlExtractor(_TreeExtractor):
+    """ Extractor over the lxml html parser """
+
+    name = "lxml"
+
+    def _parse(self, html):
+        parser = lxml.html.HTMLParser(encoding="utf-8")
+        document = lxml.html.document_fromstring(html.encode("utf-8"), parser=parser)
+        # the root is the html element, a fake parent lets selectors match it too
+        root = lxml.html.Element("document")
+        root.append(document)
+
+        return root
+
+    def _find(self, element, step):
+        for node in element.iter(step[0]):
+            if node is not element and matches(step, node.tag, node.attrib):
+                return node
+        return None
+
+    def _find_all(self, element, step):
+        return [node for node in element.iter(step[0]) if node is not element and matches(step, node.tag, node.attrib)]
+
+    def _text(self, element):
+        parts = []
+
+        def walk(node):
+            if node.text:
+                parts.append(node.text)
+            for child in node:
+                # comments have no str tag, only their tail is text
+                if isinstance(child.tag, str) and child.tag not in SKIP_TEXT_TAGS:
+                    walk(child)
+                if child.tail:
+                    parts.append(child.tail)
+
+        walk(element)
+        return "".join(parts)
+
+    def _attribute(self, element, name):
+        return element.get(name)
+
+
+class SoupExtractor(_TreeExtractor):
+    """ Extractor over a full BeautifulSoup tree, the way pages were parsed before """
+
+    name = "soup"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup, NavigableString, CData
+        self._soup = BeautifulSoup
+        self._string_types = (NavigableString, CData)
+
+    def _parse(self, html):
+        return self._soup(html, "html.parser")
+
+    @staticmethod
+    def _attrs(node):
+        attrs = dict(node.attrs)
+        if isinstance(attrs.get("class"), list):
+            attrs["class"] = " ".join(attrs["class"])
+        return attrs
+
+    def _find(self, element, step):
+        return element.find(lambda node: matches(step, node.name, self._attrs(node)))
+
+    def _find_all(self, element, step):
+        return element.find_all(lambda node: matches(step, node.name, self._attrs(node)))
+
+    def _text(self, element):
+        return "".join(s for s in element.descendants
+                       if type(s) in self._string_types and s.parent.name not in SKIP_TEXT_TAGS)
+
+    def _attribute(self, element, name):
+        return self._attrs(element).get(name)
+
+
+def get_extractor(name = None):
+    """
+    Get an extractor backend.
+
+    :param name: optional, "lxml", "stream" or "soup", the fastest available by default.
+    :return: extractor object.
+    """
+    if name is None:
+        name = "lxml" if lxml is not None else "stream"
+
+    if name == "lxml":
+        if lxml is None:
+            raise ExtractionError("lxml backend not available, install lxml")
+        return LxmlExtractor()
+    if name == "stream":
+        return StreamingExtractor()
+    if name == "soup":
+        return SoupExtractor()
+
+    raise ExtractionError("unknown extractor backend %s" % (name))
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: file_types.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Detection of the type of the unhidden files from their first bytes """
+
+import mimetypes, struct
+
+
+# bytes looked at, enough for every signature and for libmagic on most types
+HEADER_SIZE = 8192
+
+# offset, signature, mime type and extension of the most common files
+SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (0, b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (0, b"GIF87a", "image/gif", ".gif"),
+    (0, b"GIF89a", "image/gif", ".gif"),
+    (0, b"BM", "image/bmp", ".bmp"),
+    (0, b"II*\x00", "image/tiff", ".tiff"),
+    (0, b"MM\x00*", "image/tiff", ".tiff"),
+    (0, b"%PDF-", "application/pdf", ".pdf"),
+    (0, b"PK\x03\x04", "application/zip", ".zip"),
+    (0, b"\x1f\x8b", "application/gzip", ".gz"),
+    (0, b"BZh", "application/x-bzip2", ".bz2"),
+    (0, b"\xfd7zXZ\x00", "application/x-xz", ".xz"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed", ".7z"),
+    (0, b"Rar!\x1a\x07", "application/x-rar", ".rar"),
+    (257, b"ustar", "application/x-tar", ".tar"),
+    (0, b"OggS", "audio/ogg", ".ogg"),
+    (0, b"fLaC", "audio/flac", ".flac"),
+    (0, b"ID3", "audio/mpeg", ".mp3"),
+    (4, b"ftyp", "video/mp4", ".mp4"),
+    (0, b"\x7fELF", "application/x-executable", ".elf"),
+    (0, b"MZ", "application/x-dosexec", ".exe"),
+    (0, b"SQLite format 3\x00", "application/x-sqlite3", ".sqlite"),
+)
+
+# RIFF files tell their format at offset 8
+RIFF_FORMATS = {b"WEBP": ("image/webp", ".webp"), b"WAVE": ("audio/x-wav", ".wav"),
+                b"AVI ": ("video/x-msvideo", ".avi")}
+
+# control characters that may appear in plain text
+TEXT_CONTROLS = set(b"\t\n\r\f\b")
+
+# sizes of the DIB header of the known BMP versions
+BMP_DIB_SIZES = (12, 40, 52, 56, 64, 108, 124)
+
+
+def _is_bmp(header):
+    """ BM followed by a known DIB header size """
+    return len(header) >= 18 and struct.unpack_from("<I", header, 14)[0] in BMP_DIB_SIZES
+
+
+def _is_id3(header):
+    """ ID3 followed by a version 2 to 4 and a syncsafe size """
+    return len(header) >= 10 and header[3] in (2, 3, 4) and header[4] != 0xFF and \
+        all(byte < 0x80 for byte in header[6:10])
+
+
+def _is_pe(header):
+    """ MZ whose e_lfanew points to the PE signature """
+    if len(header) < 0x40:
+        return False
+    e_lfanew = struct.unpack_from("<I", header, 0x3C)[0]
+
+    return header[e_lfanew:e_lfanew + 4] == b"PE\x00\x00"
+
+
+def _is_bzip2(header):
+    """ BZh followed by the block size and the magic of a block or of the end of stream """
+    return header[3:4].isdigit() and header[3:4] != b"0" and header[4:10] in (b"1AY&SY", b"\x17rE8P\x90")
+
+
+# signatures short enough to start a text, the rest of the header must be valid too
+WEAK_SIGNATURES = {b"BM": _is_bmp, b"ID3": _is_id3, b"MZ": _is_pe, b"BZh": _is_bzip2}
+
+
+def detect(header):
+    """
+    Find the type of a file in the signature table.
+
+    :param header: bytes with the beginning of the file.
+    :return: str with the mime type, None if not known.
+    """
+    if header[:4] == b"RIFF" and header[8:12] in RIFF_FORMATS:
+        return RIFF_FORMATS[header[8:12]][0]
+
+    for offset, signature, mime, _ in SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            if signature in WEAK_SIGNATURES and not WEAK_SIGNATURES[signature](header):
+                continue
+            return mime
+
+    return None
+
+
+def is_plain_text(header):
+    """
+    Check if a header looks like plain text, UTF-8 without
+    control characters. Markup and structured text are left
+    to libmagic, it tells them apart.
+
+    :param header: bytes with the beginning of the file.
+    :return: bool
+    """
+    if header.lstrip()[:1] in (b"<", b"{", b"["):
+        return False
+
+    try:
+        # the header may cut the last character
+        header.decode("utf-8")
+    except UnicodeDecodeError as ude:
+        if ude.start < len(header) - 3:
+            return False
+
+    return not any(byte < 0x20 and byte not in TEXT_CONTROLS for byte in header)
+
+
+def guess_type(header):
+    """
+    Get the mime type of a file from its header, libmagic is
+    used only for the types not in the signature table.
+
+    :param header: bytes with the first HEADER_SIZE bytes of the file, or less.
+    :return: str with the mime type.
+    """
+    header = bytes(header[:HEADER_SIZE])
+    if header == b"":
+        return "application/x-empty"
+
+    mime = detect(header)
+    if mime is not None:
+        return mime
+    if is_plain_text(header):
+        return "text/plain"
+
+    ##########IMPORTANT NOTE##########
+    ##Libmagic dependencies must be installed on system
+    ##-Check https://pypi.org/project/python-magic/ for more information
+    import magic
+
+    return magic.from_buffer(header, mime=True)
+
+
+def guess_file_type(path):
+    """ Get the mime type of a file, reading only its header """
+    with open(path, "rb") as f:
+        return guess_type(f.read(HEADER_SIZE))
+
+
+def extension(mime):
+    """
+    Get the extension for files of a mime type.
+
+    :param mime: str with the mime type.
+    :return: str with the extension, empty if not known.
+    """
+    if mime == "text/plain":
+        return ".txt"
+
+    for _, _, signature_mime, signature_extension in SIGNATURES:
+        if signature_mime == mime:
+            return signature_extension
+    for riff_mime, riff_extension in RIFF_FORMATS.values():
+        if riff_mime == mime:
+            return riff_extension
+
+    return mimetypes.guess_extension(mime) or ''
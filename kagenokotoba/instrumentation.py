@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: instrumentation.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Per stage timers and counters of a run, disabled by default """
+
+import os, sys, json, time, contextlib
+
+
+# stages are timed only while some Stats is enabled, this is the one
+_active = None
+
+
+class _NullStage():
+    """ Context manager doing nothing, the stage of disabled stats """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stats():
+    """
+    Timers and counters of the stages of a run, with
+    optional cProfile and tracemalloc capture.
+    """
+
+    def __init__(self, profile = False, trace_memory = False):
+        """
+        Constructor of the class Stats.
+
+        :param profile: optional, capture a cProfile of the run.
+        :param trace_memory: optional, capture the peak of allocated memory.
+        """
+        self.timers = {}
+        self.counters = {}
+        self.profiler = None
+        self.trace_memory = trace_memory
+        self.started = time.time()
+
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            import tracemalloc
+            self.counters["peak_alloc_bytes"] = max(self.counters.get("peak_alloc_bytes", 0),
+                                                    tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Time the block as a run of the given stage """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += 1
+            timer[1] += time.perf_counter() - start
+
+    def count(self, name, value = 1):
+        """ Add value to the given counter """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, report):
+        """ Add the timers and counters of a report of other process """
+        for name, timer in report["stages"].items():
+            own = self.timers.setdefault(name, [0, 0.0])
+            own[0] += timer["calls"]
+            own[1] += timer["seconds"]
+        for name, value in report["counters"].items():
+            if name == "peak_alloc_bytes":
+                self.counters[name] = max(self.counters.get(name, 0), value)
+            else:
+                self.count(name, value)
+
+    def report(self):
+        """
+        Get the timers and counters.
+
+        :return: dict with stages name -> {calls, seconds} and counters name -> value.
+        """
+        return {"pid": os.getpid(), "started": self.started, "elapsed": time.time() - self.started,
+                "stages": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.timers.items()},
+                "counters": dict(self.counters)}
+
+    def dump_profile(self, path):
+        """ Write the cProfile capture in pstats format """
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+
+def enable(profile = False, trace_memory = False):
+    """
+    Start collecting stats in this process.
+
+    :return: Stats being collected.
+    """
+    global _active
+    disable()
+    _active = Stats(profile, trace_memory)
+    _active.start()
+
+    return _active
+
+
+def disable():
+    """
+    Stop collecting stats in this process.
+
+    :return: Stats collected, None if they were not enabled.
+    """
+    global _active
+    stats, _active = _active, None
+    if stats is not None:
+        stats.stop()
+
+    return stats
+
+
+def stage(name):
+    """ Context manager timing a stage, it does nothing when stats are disabled """
+    if _active is None:
+        return _NULL_STAGE
+
+    return _active.stage(name)
+
+
+def count(name, value = 1):
+    """ Add value to a counter, it does nothing when stats are disabled """
+    if _active is not None:
+        _active.count(name, value)
+
+
+def merge(report):
+    """ Add a report of other process to the stats, it does nothing when stats are disabled """
+    if _active is not None:
+        _active.merge(report)
+
+
+def write_jsonl(record, path = "-"):
+    """
+    Append a record as a line of JSON.
+
+    :param record: dict to write.
+    :param path: optional, file where to append it, "-" for the standard error.
+    """
+    line = json.dumps(record, sort_keys=True) + "\n"
+    if path == "-":
+        sys.stderr.write(line)
+        return
+
+    with open(path, "a") as f:
+        f.write(line)
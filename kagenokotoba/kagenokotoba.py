@@ -15,14 +15,12 @@ File: main.py
 
 """ App entry point """
 
-import text_stego, crawler
-from art import *
+# only light modules are imported here, the stego library, the
+# crawler and the banner fonts are imported by the commands using them
+import instrumentation
 import colorama as cla
-import sys, random, signal
-from os import name, system, remove
-import text_stego as stego
-
-from text_stego import InvalidBitValue, InvalidCharacter
+import sys, os, random, signal, argparse, json
+from os import name, system
 
 def sigint_handler(signum, frame):
     """ Handler for SIGINT interruption (CTRL+C) """
@@ -41,6 +39,8 @@ def clear_screen():
 
 def banner():
     """ Clean screen and print new banner """
+    from art import text2art
+
     clear_screen()
     logo = text2art("Kage no Kotoba",font="katakana")
     print(cla.Fore.GREEN + logo)
@@ -50,7 +50,19 @@ def banner():
     print(cla.Fore.BLUE + author_text)
     print("*" * 116 + "\n")
 
-def menu():
+def heading(title, show_banner = True):
+    """ Clean screen and print the title of a command """
+    if not show_banner:
+        return
+
+    from art import text2art
+
+    clear_screen()
+    logo_text = text2art(title,font="fancy", decoration="barcode")
+    print(cla.Fore.YELLOW + logo_text)
+    print("*" * 116 + "\n")
+
+def menu(show_banner = True):
     """ Print menu to the user """
     choices = input("""
                       1: Hide information
@@ -60,104 +72,539 @@ def menu():
                       Please enter your choice: """)
 
     if choices == str(1):
-        hideInformation()
+        hideInformation(show_banner)
     elif choices == str(2):
-        unhideInformation()
+        unhideInformation(show_banner)
     elif choices == str(3):
         sys.exit
     else:
         print("You must only select either 1,2 or 3.")
         print("Please try again")
-        menu()
+        menu(show_banner)
 
 def main():
     signal.signal(signal.SIGINT, sigint_handler)
     cla.init(autoreset=True)
-    banner()
-    menu()
 
+    args = parse_args(sys.argv[1:])
+    if args.stats or args.profile is not None:
+        instrumentation.enable(profile=args.profile is not None, trace_memory=args.trace_memory)
+
+    try:
+        if args.command is None:
+            if not args.no_banner:
+                banner()
+            menu(not args.no_banner)
+        else:
+            args.func(args)
+    finally:
+        write_stats(args)
+
+
+def write_stats(args):
+    """ Write the stats collected in this process, if they were enabled """
+    stats = instrumentation.disable()
+    if stats is None:
+        return
+
+    if args.profile is not None:
+        stats.dump_profile(args.profile)
+    if args.stats:
+        record = stats.report()
+        record.update(scope="process", command=args.command or "interactive")
+        instrumentation.write_jsonl(record, args.stats_file)
 
-def hideInformation():
+
+def parse_args(argv):
+    """ Arguments for the non interactive subcommands """
+    parser = argparse.ArgumentParser(description="Kage no Kotoba - Shadow Words")
+    parser.add_argument("--stats", action="store_true",
+                        help="write per stage timers and counters as JSON lines")
+    parser.add_argument("--stats-file", default="-", metavar="FILE",
+                        help="file where to append the stats, standard error by default")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="write a cProfile capture of the run to FILE (FILE.<task> for batch workers)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="add the peak of allocated memory to the stats")
+    parser.add_argument("--no-banner", action="store_true",
+                        help="interactive menu without banner nor screen clearing")
+    # without subcommand the interactive menu is shown
+    subparsers = parser.add_subparsers(dest="command")
+
+    hide_parser = subparsers.add_parser("hide", help="hide a file without the interactive menu")
+    hide_parser.add_argument("file", help="file to hide")
+    hide_parser.add_argument("-o", "--output", default="cover_hide.png", help="stego image to write")
+    hide_parser.add_argument("-l", "--languages", default="es,en",
+                             help="comma separated languages of the covers")
+    hide_parser.add_argument("--corpus", default=None,
+                             help="directory of an offline corpus to take the cover from instead of the web")
+    hide_parser.add_argument("--symbol-bits", type=int, default=1, choices=range(9),
+                             help="bits carried by every key character, 0 for the most the cover allows")
+    hide_parser.add_argument("-w", "--workers", type=int, default=1,
+                             help="processes generating the key, worth it only for big files")
+    hide_parser.add_argument("--compress-level", type=int, default=6, choices=range(10),
+                             help="zlib level of the stego image, lower saves faster but bigger")
+    hide_parser.set_defaults(func=hideCommand)
+
+    unhide_parser = subparsers.add_parser("unhide", help="unhide a file without the interactive menu")
+    unhide_parser.add_argument("images", nargs="+", help="stego image, or all the images of a sharded key")
+    unhide_parser.add_argument("-o", "--output", required=True, help="result file name, without extension")
+    unhide_parser.add_argument("--corpus", default=None,
+                               help="directory of the offline corpus the cover was taken from")
+    unhide_parser.add_argument("-w", "--workers", type=int, default=1,
+                               help="processes decoding the key, worth it only for big files")
+    unhide_parser.set_defaults(func=unhideCommand)
+
+    batch_parser = subparsers.add_parser("batch", help="hide many files in one run")
+    batch_parser.add_argument("payloads",
+                              help="directory with the files to hide or manifest with one path per line")
+    batch_parser.add_argument("-o", "--output", default="stego",
+                              help="directory where to write the stego images and results.json")
+    batch_parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                              help="number of worker processes")
+    batch_parser.add_argument("-r", "--cover-reuse", type=int, default=1,
+                              help="number of files hidden with every fetched cover")
+    batch_parser.add_argument("-l", "--languages", default="es,en",
+                              help="comma separated languages of the covers")
+    batch_parser.add_argument("--packed-key", action="store_true",
+                              help="hide the keys with the packed binary format")
+    batch_parser.add_argument("--compress-key", action="store_true",
+                              help="deflate the packed keys")
+    batch_parser.add_argument("--lsb-bits", type=int, default=1, choices=(1, 2, 3, 4),
+                              help="LSBs used from every channel of the cover image")
+    batch_parser.add_argument("--corpus", default=None,
+                              help="directory of an offline corpus to take the covers from instead of the web")
+    batch_parser.add_argument("--seed", type=int, default=None,
+                              help="seed of the choice of covers, to repeat a run")
+    batch_parser.add_argument("--cover-attempts", type=int, default=5,
+                              help="covers fetched before giving up when they are too small")
+    batch_parser.add_argument("--shards", type=int, default=1,
+                              help="cover images where to split every key")
+    batch_parser.add_argument("--symbol-bits", type=int, default=1, choices=range(9),
+                              help="bits carried by every key character, 0 for the most the cover allows")
+    batch_parser.add_argument("--compress-level", type=int, default=6, choices=range(10),
+                              help="zlib level of the stego images, lower saves faster but bigger")
+    batch_parser.set_defaults(func=batchHideInformation)
+
+    corpus_parser = subparsers.add_parser("corpus", help="index an offline corpus of covers")
+    corpus_parser.add_argument("corpus_dir", help="directory with <id>.txt texts and <id>.png images")
+    corpus_parser.set_defaults(func=indexCorpus)
+
+    return parser.parse_args(argv)
+
+
+def hideInformation(show_banner = True):
     """ Call to stego library to hide message in a text and finally hide key and url in an image """
-    clear_screen()
-    logo_text = text2art("Hiding information",font="fancy", decoration="barcode")
-    print(cla.Fore.YELLOW + logo_text)
-    print("*" * 116 + "\n")
+    heading("Hiding information", show_banner)
 
     secret_file = input("[*]Enter file to hide: ")
+    hide_file(secret_file)
+
+
+def hideCommand(args):
+    """ Non interactive hide """
+    languages = args.languages.split(",")
+    if args.corpus is not None:
+        set_corpus(args.corpus)
+        languages = ["corpus"]
+
+    hide_file(args.file, args.output, languages, args.symbol_bits, args.workers, args.compress_level)
 
-    print("[*]Generating cover files...")
-    languages = ["es", "en"]
-    source = crawler.SourceFinding(source_language=random.choice(languages))
-    url, source = source.generate()
-    print("[*]Cover files fetched from: %s" % url)
+
+def set_corpus(corpus_dir):
+    """ Take the corpus covers from the given directory """
+    import crawler
+
+    crawler.get_cover_source("corpus").corpus_dir = os.path.abspath(corpus_dir)
+
+
+def hide_file(secret_file, output = "cover_hide.png", languages = ("es", "en"), symbol_bits = 1, workers = 1,
+              compress_level = 6):
+    """ Hide a file in a new cover and print the generated key and stego image """
+    import text_stego as stego
+    from text_stego import InvalidBitValue, NotValidTextException
+    from cover_cache import text_hash
+    from planner import CapacityPlan, CapacityError, select_cover
+    from file_types import guess_file_type
 
     try:
-        ph = stego.ParagraphsHiding('cover.txt', file_to_hide=secret_file)
-        key = ph.hide_information()
+        plan = CapacityPlan(os.path.getsize(secret_file), symbol_bits=symbol_bits)
+        print("[*]Cover image of %d pixels needed" % (plan.required_pixels()))
+
+        print("[*]Generating cover...")
+        cover, ph = select_cover(plan, list(languages))
+        print("[*]Cover fetched from: %s" % cover.url)
+
+        ph.set_data_to_hide(secret_file)
+        key = ph.hide_information(workers=workers)
 
         print("[*]File %s hidden using cover text words" % (secret_file))
         print(cla.Fore.LIGHTRED_EX + "[*]Generated Key: %s" % (key))
 
-        ih = stego.ImageHiding('cover.png', key_to_hide=key, url_metadata=url, url_language=source)
-        ih.hide_information()
-        print(cla.Fore.LIGHTRED_EX + "[*]Stego file generated => cover_hide.png")
+        ih = stego.ImageHiding(cover.image, key_to_hide=key, url_metadata=cover.url, url_language=cover.language,
+                               text_hash=text_hash(cover.text), symbol_bits=ph.symbol_bits,
+                               file_type=guess_file_type(secret_file), compress_level=compress_level)
+        f_name = ih.hide_information(output)
+        print(cla.Fore.LIGHTRED_EX + "[*]Stego file generated => %s" % (f_name))
     except InvalidBitValue as ibv:
         print(cla.Fore.RED + "[-]Error hidding message in text: %s" % (str(ibv)))
         sys.exit(1)
+    except CapacityError as ce:
+        print(cla.Fore.RED + "[-]Error finding a cover: %s" % (str(ce)))
+        sys.exit(1)
+    except NotValidTextException as nvt:
+        print(cla.Fore.RED + "[-]Error with cover text: %s" % (str(nvt)))
+        sys.exit(1)
     except FileNotFoundError as fnf:
         print(cla.Fore.RED + "[-]Error with file hidding message in text: %s" % (str(fnf)))
         sys.exit(1)
     except ValueError as ve:
         print(cla.Fore.RED + "[-]Error of value hiding message in text: %s" % (str(ve)))
         sys.exit(1)
-    finally:
-        remove("cover.txt")
-        remove("cover.png")
-        print("[*]Cover files removed!!")
 
 
-def unhideInformation():
+def unhideInformation(show_banner = True):
     """ Extract key and download text to unhide the message """
-    clear_screen()
-    logo_text = text2art("UnHiding information",font="fancy", decoration="barcode")
-    print(cla.Fore.YELLOW + logo_text)
-    print("*" * 116 + "\n")
+    heading("UnHiding information", show_banner)
 
-    secret_file = input("[*]Enter file to unhide: ")
+    secret_files = input("[*]Enter file to unhide (comma separated files for shards): ")
     target_file = input("[*]Enter result file name (whitout extension): ")
 
-    uh = stego.ImageHiding(secret_file)
-    key, url, language = uh.unhide_information()
+    unhide_files([f.strip() for f in secret_files.split(",") if f.strip()], target_file)
+
+
+def unhideCommand(args):
+    """ Non interactive unhide """
+    if args.corpus is not None:
+        set_corpus(args.corpus)
+
+    unhide_files(args.images, args.output, args.workers)
+
+
+def unhide_files(secret_files, target_file, workers = 1):
+    """ Recover the file hidden with the key of one stego image or of the shards of a key """
+    import text_stego as stego
+    from text_stego import InvalidCharacter, NotValidTextException
+    from sharding import ShardError, unhide_shards
+
+    try:
+        if len(secret_files) > 1:
+            key, url, language, expected_hash = unhide_shards(secret_files)
+            first_shard = stego.ImageHiding(secret_files[0])
+            symbol_bits = first_shard.recover_symbol_bits()
+            file_type = first_shard.recover_file_type()
+        else:
+            uh = stego.ImageHiding(secret_files[0])
+            shard = uh.recover_shard()
+            if shard is not None and shard[1] > 1:
+                raise ShardError("shard %d of %d, all shards are needed" % (shard[0], shard[1]))
+            key, url, language = uh.unhide_information()
+            expected_hash = uh.recover_text_hash()
+            symbol_bits = uh.recover_symbol_bits()
+            file_type = uh.recover_file_type()
+    except ShardError as se:
+        print(cla.Fore.RED + "[-]Error joining the shards of the key: %s" % (str(se)))
+        sys.exit(1)
+    except (FileNotFoundError, ValueError) as e:
+        print(cla.Fore.RED + "[-]Error extracting the key from the image: %s" % (str(e)))
+        sys.exit(1)
     print("[*]Recovered URL: %s (language: %s)" % (url, language))
     print(cla.Fore.GREEN + "[*]Recovered key: %s" % key)
 
-    print("[*]enerating cover files from recovered data...")
-    uSource = crawler.SourceFinding()
-    if language == "es":
-        uSource.get_source_es(url)
-    elif language == "en":
-        uSource.get_source_en(url)
-    else:
-        uSource.get_source_ru(url)
-    print("[*]Cover files fetched from: %s" % url)
-
     try:
-        dh = stego.ParagraphsHiding('cover.txt',key=key, file_to_unhide=target_file)
-        f_name = dh.unhide_information()
+        cover_text = get_cover_text(url, language, expected_hash)
+
+        dh = stego.ParagraphsHiding(text_where_to_hide=cover_text, key=key, file_to_unhide=target_file,
+                                    symbol_bits=symbol_bits)
+        f_name = dh.unhide_information(file_type, workers=workers)
 
         print(cla.Fore.GREEN + "[*]File unhidden: %s" % (f_name))
 
     except InvalidCharacter as ic:
         print(cla.Fore.RED + "[-]Error extracting original message from text: %s" % (str(ic)))
         sys.exit(1)
+    except NotValidTextException as nvt:
+        print(cla.Fore.RED + "[-]Error with cover text: %s" % (str(nvt)))
+        sys.exit(1)
     except FileNotFoundError as fnf:
         print(cla.Fore.RED + "[-]Error with file extracting original message from text: %s" % (str(fnf)))
         sys.exit(1)
+    except ValueError as ve:
+        print(cla.Fore.RED + "[-]Error of value extracting original message from text: %s" % (str(ve)))
+        sys.exit(1)
+
+def get_cover_text(url, language, expected_hash = ''):
+    """
+    Get the text of the cover used to hide a message, from
+    the local cache when possible, the image is not needed.
+
+    :param expected_hash: optional, hash of the text recorded when hiding.
+    :return: str with the cover text.
+    """
+    import crawler
+    from text_stego import NotValidTextException
+    from cover_cache import CoverCache, text_hash
+
+    # corpus covers are local files already
+    if url.startswith(crawler.CoverSource.CORPUS_SCHEME):
+        cover = crawler.SourceFinding(source_url=url, source_language=language).generate(fetch_image=False)
+        if expected_hash != '' and text_hash(cover.text) != expected_hash:
+            raise NotValidTextException("corpus document %s changed since the message was hidden" % (url))
+        return cover.text
+
+    cache = CoverCache()
+    cover_text = cache.get(url, expected_hash)
+    if cover_text is not None:
+        print("[*]Cover text found in local cache")
+        return cover_text
+
+    print("[*]Fetching cover text from recovered data...")
+    cover = crawler.SourceFinding(source_url=url, source_language=language).generate(fetch_image=False)
+    print("[*]Cover text fetched from: %s" % url)
+
+    if expected_hash != '' and text_hash(cover.text) != expected_hash:
+        raise NotValidTextException("cover page %s changed since the message was hidden" % (url))
+
+    cache.put(url, cover.text)
+    return cover.text
+
+
+def list_payloads(payloads):
+    """
+    Files to hide from a directory or from a manifest with one path per line.
+
+    :return: list with the paths of the files and str with the directory their names are relative to.
+    """
+    if os.path.isdir(payloads):
+        base_dir = os.path.abspath(payloads)
+        return sorted(os.path.join(base_dir, f) for f in os.listdir(base_dir)
+                      if os.path.isfile(os.path.join(base_dir, f))), base_dir
+
+    base_dir = os.path.dirname(os.path.abspath(payloads))
+    with open(payloads, "r") as f:
+        return [os.path.normpath(os.path.join(base_dir, line.strip())) for line in f if line.strip()], base_dir
+
+
+def stego_name(payload, base_dir):
+    """
+    Name of the stego image of a payload, its path relative to the
+    directory or manifest so files with the same name in different
+    directories do not overwrite each other. Files out of base_dir
+    keep the part of their path below it.
+
+    :return: str with the relative path, without the .png extension.
+    """
+    parts = os.path.relpath(payload, base_dir).split(os.sep)
+    while len(parts) > 1 and parts[0] == os.pardir:
+        parts.pop(0)
+
+    return os.path.join(*parts)
+
+
+def check_stego_names(payloads, base_dir):
+    """
+    Find the payloads that would be saved in the same stego image.
+
+    :return: list with the paths of every payload whose name is already taken.
+    """
+    names = {}
+    clashes = []
+    for payload in payloads:
+        name = stego_name(payload, base_dir)
+        if name in names:
+            clashes.append("%s and %s => %s" % (names[name], payload, name))
+        names.setdefault(name, payload)
+
+    return clashes
+
+
+def hide_with_cover(payloads, output_dir, languages, options, seed = None):
+    """
+    Fetch one cover big enough for the biggest of the given
+    files and hide every one of them with it, run inside a
+    worker process of the batch mode.
+
+    :param seed: optional, seed of the choice of the cover.
+    :return: list with a result dict per file and dict with the stats of the task, None if disabled.
+    """
+    if options["stats"]:
+        instrumentation.enable(profile=options["profile"] is not None, trace_memory=options["trace_memory"])
+    try:
+        results = hide_payloads(payloads, output_dir, languages, options, seed)
     finally:
-        remove("cover.txt")
-        remove("cover.png")
-        print("[*]Cover files removed!!")
+        stats = instrumentation.disable()
+
+    if stats is None:
+        return results, None
+
+    if options["profile"] is not None:
+        stats.dump_profile("%s.%s" % (options["profile"], os.path.basename(payloads[0])))
+    return results, stats.report()
+
+
+def hide_payloads(payloads, output_dir, languages, options, seed = None):
+    """ Body of hide_with_cover """
+    import crawler
+    import text_stego as stego
+    from text_stego import InvalidBitValue, NotValidTextException
+    from cover_cache import text_hash
+    from planner import CapacityPlan, select_cover
+    from sharding import hide_shards
+    from file_types import guess_file_type
+
+    if options["corpus"] is not None:
+        crawler.get_cover_source("corpus").corpus_dir = options["corpus"]
+    if seed is not None:
+        random.seed(seed)
+
+    # sizes are known before fetching anything
+    plans = {}
+    errors = {}
+    for payload in payloads:
+        try:
+            plans[payload] = CapacityPlan(os.path.getsize(payload), lsb_bits=options["lsb_bits"],
+                                          packed_key=options["packed_key"], compress_key=options["compress_key"],
+                                          symbol_bits=options["symbol_bits"])
+        except OSError as e:
+            errors[payload] = {"file": payload, "status": "error", "error": str(e)}
+
+    cover = None
+    if plans:
+        try:
+            # with shards every image holds only a part of the biggest key
+            shards = options["shards"]
+            plan = max(plans.values(), key=lambda plan: plan.payload_size)
+            plan = CapacityPlan(-(-plan.payload_size // shards), lsb_bits=plan.lsb_bits,
+                                packed_key=plan.packed_key, compress_key=plan.compress_key,
+                                symbol_bits=plan.symbol_bits)
+
+            cover, ph = select_cover(plan, languages, attempts=options["cover_attempts"])
+            images = [cover.image] + [select_cover(plan, languages, attempts=options["cover_attempts"])[0].image
+                                      for _ in range(shards - 1)]
+        except Exception as e:
+            for payload, plan in plans.items():
+                errors[payload] = {"file": payload, "status": "error", "error": "cover: %s" % (str(e)),
+                                   "capacity": plan.report()}
+
+    results = []
+    for payload in payloads:
+        if payload in errors:
+            results.append(errors[payload])
+            continue
+
+        result = {"file": payload, "url": cover.url, "language": cover.language,
+                  "capacity": plans[payload].report()}
+        try:
+            ph.set_data_to_hide(payload)
+            key = ph.hide_information()
+            file_type = guess_file_type(payload)
+
+            name = os.path.join(output_dir, stego_name(payload, options["payloads_dir"]))
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+
+            if len(images) > 1:
+                # this is already a worker process, shards are hidden one after the other
+                outputs = ["%s.%d.png" % (name, i) for i in range(len(images))]
+                f_name = hide_shards(key, images, outputs, url_metadata=cover.url, url_language=cover.language,
+                                     packed_key=options["packed_key"], compress_key=options["compress_key"],
+                                     lsb_bits=options["lsb_bits"], text_hash=text_hash(cover.text),
+                                     symbol_bits=ph.symbol_bits, file_type=file_type,
+                                     compress_level=options["compress_level"], workers=1)
+            else:
+                ih = stego.ImageHiding(cover.image, key_to_hide=key, url_metadata=cover.url,
+                                       url_language=cover.language, packed_key=options["packed_key"],
+                                       compress_key=options["compress_key"], lsb_bits=options["lsb_bits"],
+                                       text_hash=text_hash(cover.text), symbol_bits=ph.symbol_bits,
+                                       file_type=file_type, compress_level=options["compress_level"])
+                f_name = ih.hide_information(name + ".png")
+
+            result.update(status="ok", stego=f_name, key_length=len(key), symbol_bits=ph.symbol_bits,
+                          file_type=file_type)
+        except (InvalidBitValue, NotValidTextException, ValueError, OSError) as e:
+            # unreadable payloads, images that can not be saved, ... fail only their file
+            result.update(status="error", error=str(e))
+        results.append(result)
+
+    return results
+
+
+def batchHideInformation(args):
+    """ Hide every file of a directory or manifest using a pool of processes """
+    from concurrent.futures import ProcessPoolExecutor
+    from corpus import Corpus
+
+    payloads, payloads_dir = list_payloads(args.payloads)
+    clashes = check_stego_names(payloads, payloads_dir)
+    if clashes:
+        print(cla.Fore.RED + "[-]Files with the same stego image: %s" % ("; ".join(clashes)))
+        sys.exit(1)
+
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+
+    languages = args.languages.split(",")
+    corpus_dir = None
+    if args.corpus is not None:
+        # index once here instead of in every worker
+        corpus_dir = os.path.abspath(args.corpus)
+        Corpus(corpus_dir)
+        languages = ["corpus"]
+
+    options = {"packed_key": args.packed_key, "compress_key": args.compress_key, "lsb_bits": args.lsb_bits,
+               "corpus": corpus_dir, "cover_attempts": args.cover_attempts, "shards": max(1, args.shards),
+               "stats": args.stats or args.profile is not None, "profile": args.profile,
+               "trace_memory": args.trace_memory, "symbol_bits": args.symbol_bits,
+               "compress_level": args.compress_level, "payloads_dir": payloads_dir}
+    reuse = max(1, args.cover_reuse)
+    tasks = [payloads[i:i + reuse] for i in range(0, len(payloads), reuse)]
+
+    print("[*]Hiding %d files with %d covers" % (len(payloads), len(tasks)))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(hide_with_cover, task, output_dir, languages, options,
+                                   None if args.seed is None else args.seed + i)
+                   for i, task in enumerate(tasks)]
+        for task, future in zip(tasks, futures):
+            try:
+                task_results, task_stats = future.result()
+            except Exception as e:
+                # a broken task fails its files, the rest of the results are still written
+                task_results = [{"file": payload, "status": "error", "error": "task failed: %s" % (str(e))}
+                                for payload in task]
+                task_stats = None
+            if task_stats is not None:
+                instrumentation.merge(task_stats)
+                if args.stats:
+                    task_stats.update(scope="task", files=[result["file"] for result in task_results])
+                    instrumentation.write_jsonl(task_stats, args.stats_file)
+
+            for result in task_results:
+                if result["status"] == "ok":
+                    stego_files = result["stego"] if isinstance(result["stego"], list) else [result["stego"]]
+                    print(cla.Fore.GREEN + "[*]%s => %s" % (result["file"], ", ".join(stego_files)))
+                else:
+                    print(cla.Fore.RED + "[-]%s: %s" % (result["file"], result["error"]))
+                results.append(result)
+
+    manifest = os.path.join(output_dir, "results.json")
+    with open(manifest, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print("[*]Results written => %s" % (manifest))
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+
+def indexCorpus(args):
+    """ Index the documents of an offline corpus, again if it was already indexed """
+    from corpus import Corpus
+
+    corpus = Corpus(args.corpus_dir, rebuild=True)
+
+    print("[*]Indexed %d documents, %d with image => %s" % (len(corpus.documents),
+          len([d for d in corpus.documents if d["image"] is not None]), corpus.index_dir))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: key_packing.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Compact binary format for the keys generated by the text stego """
+
+import struct, zlib
+import numpy as np
+
+
+# text keys are made of alphabetic characters, so they never start with this
+KEY_MAGIC = b"KNK\x01"
+
+FLAG_DEFLATE = 0x01
+
+# flags, bits per symbol, key length, alphabet size in bytes
+_HEADER = struct.Struct(">BBQH")
+
+
+def deflate_bound(size):
+    """ Maximum size of size bytes once deflated, as zlib compressBound """
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
+
+def packed_overhead(alphabet_size):
+    """
+    Bytes of a packed key besides its symbols, the magic,
+    the header and an alphabet of up to 4 bytes per letter.
+
+    :param alphabet_size: int with the distinct letters of the key.
+    :return: int
+    """
+    return len(KEY_MAGIC) + _HEADER.size + 4 * alphabet_size
+
+
+def is_packed_key(data):
+    """
+    Check if the given bytes are a packed key.
+
+    :param data: bytes recovered from an image.
+    :return: bool
+    """
+    return data[:len(KEY_MAGIC)] == KEY_MAGIC
+
+
+def pack_key(key, compress = False):
+    """
+    Pack a text key as a header followed by the key
+    characters mapped to indexes of the key alphabet,
+    using just the bits needed for every index.
+
+    :param key: str with the key generated by ParagraphsHiding.
+    :param compress: optional, deflate the packed indexes.
+    :return: bytes with the packed key.
+    """
+    codes = np.frombuffer(key.encode("utf-32-le"), dtype = "<u4")
+    alphabet, symbols = np.unique(codes, return_inverse = True)
+    bits_per_symbol = max(1, (alphabet.size - 1).bit_length())
+
+    # index bits of every character, most significant first
+    shifts = np.arange(bits_per_symbol - 1, -1, -1, dtype = "uint16")
+    bits = (symbols.astype("uint16")[:, None] >> shifts) & 1
+    body = np.packbits(bits.astype("uint8")).tobytes()
+
+    flags = 0
+    if compress:
+        flags |= FLAG_DEFLATE
+        body = zlib.compress(body, 9)
+
+    alphabet_bytes = alphabet.astype("<u4").tobytes().decode("utf-32-le").encode("utf-8")
+
+    header = KEY_MAGIC + _HEADER.pack(flags, bits_per_symbol, len(key), len(alphabet_bytes))
+    return header + alphabet_bytes + body
+
+
+def unpack_key(data):
+    """
+    Recover the text key from a packed key.
+
+    :param data: bytes with the packed key.
+    :return: str with the key.
+    """
+    if not is_packed_key(data):
+        raise ValueError("unpack_key: data is not a packed key")
+
+    offset = len(KEY_MAGIC)
+    try:
+        flags, bits_per_symbol, len_key, len_alphabet = _HEADER.unpack_from(data, offset)
+    except struct.error:
+        raise ValueError("unpack_key: truncated header")
+    offset += _HEADER.size
+
+    alphabet = data[offset:offset + len_alphabet].decode("utf-8")
+    alphabet = np.frombuffer(alphabet.encode("utf-32-le"), dtype = "<u4")
+    body = data[offset + len_alphabet:]
+
+    if flags & FLAG_DEFLATE:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as ze:
+            raise ValueError("unpack_key: corrupted body (%s)" % (str(ze)))
+
+    bits = np.unpackbits(np.frombuffer(body, dtype = "uint8"))
+    if bits.size < len_key * bits_per_symbol:
+        raise ValueError("unpack_key: truncated body")
+
+    weights = 1 << np.arange(bits_per_symbol - 1, -1, -1)
+    symbols = bits[:len_key * bits_per_symbol].reshape(len_key, bits_per_symbol) @ weights
+    if symbols.size > 0 and symbols.max() >= alphabet.size:
+        raise ValueError("unpack_key: symbol out of the alphabet")
+
+    return alphabet[symbols].astype("<u4").tobytes().decode("utf-32-le")
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: parallel.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Keys of big payloads generated and decoded by ranges in a pool of processes """
+
+import os, copy
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python older than 3.8, only a single worker can be used
+    shared_memory = None
+
+from text_stego import InvalidCharacter
+
+
+# bytes of the payload hidden by every task, the key of a range takes 8 / symbol_bits times more
+DEFAULT_CHUNK_BYTES = 2 ** 22
+
+# state of every worker process, set once by _init_worker
+_worker = {}
+
+
+def _key_format(ph):
+    """
+    Encoding of the key characters in the shared buffers, one
+    byte per character when all the letters of the text fit.
+
+    :param ph: ParagraphsHiding with the cover text.
+    :return: str with the codec and numpy dtype of a character.
+    """
+    if ph.words_count > 0 and max(int(ph.first_letters.max()), int(ph.last_letters.max())) > 0xFF:
+        return "utf-32-le", "<u4"
+
+    return "latin-1", "uint8"
+
+
+def _template(ph):
+    """ Copy of ph sent to the workers, the payload and the key go through shared memory """
+    template = copy.copy(ph)
+    template.byte_array_to_hide = None
+    template.key = ''
+    template.text = ''
+    template.clean_words = []
+    template.cover_index = None
+
+    return template
+
+
+def check_workers(workers):
+    """ Fail early when several workers are asked for and this Python can not run them """
+    if workers != 1 and shared_memory is None:
+        raise ValueError("several workers need Python 3.8 or greater, use 1 worker")
+
+
+def _workers(workers):
+    if workers is None:
+        return os.cpu_count() or 1
+
+    return workers
+
+
+def _init_worker(template, payload, key, key_format, output = None):
+    """
+    Attach a worker to the buffers of the run.
+
+    :param payload: tuple with "file" and path of a mapped payload, or "memory", name and size of a shared one.
+    :param key: tuple with name, characters and position in the whole key of the shared key.
+    :param output: optional, path of the mapped file where to write the unhidden bytes.
+    """
+    _worker.update(ph=template, encoding=key_format[0], memories=[])
+
+    if payload is not None and payload[0] == "file":
+        template.byte_array_to_hide = np.memmap(payload[1], dtype = "uint8", mode = "r")
+    elif payload is not None:
+        memory = shared_memory.SharedMemory(name=payload[1])
+        _worker["memories"].append(memory)
+        template.byte_array_to_hide = np.ndarray((payload[2],), dtype = "uint8", buffer = memory.buf)
+
+    memory = shared_memory.SharedMemory(name=key[0])
+    _worker["memories"].append(memory)
+    _worker["key"] = np.ndarray((key[1],), dtype = key_format[1], buffer = memory.buf)
+    _worker["key_position"] = key[2]
+
+    if output is not None:
+        _worker["output"] = np.memmap(output, dtype = "uint8", mode = "r+")
+
+
+def _hide_chunk(start, stop, block_bytes):
+    ph = _worker["ph"]
+    codes = np.frombuffer(ph.hide_range(start, stop, block_bytes).encode(_worker["encoding"]),
+                          dtype = _worker["key"].dtype)
+
+    position = start * 8 // ph.symbol_bits
+    _worker["key"][position:position + codes.size] = codes
+
+
+def _unhide_chunk(start, stop, block_chars):
+    ph = _worker["ph"]
+    shared = slice(start - _worker["key_position"], stop - _worker["key_position"])
+    key = _worker["key"][shared].tobytes().decode(_worker["encoding"])
+
+    written = start * ph.symbol_bits // 8
+    for block in ph.unhide_range(key, start, block_chars):
+        _worker["output"][written:written + block.size] = block
+        written += block.size
+
+
+def _run(function, workers, initargs, *iterables):
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        # results are waited for in order, the first error of the key is the one raised
+        for _ in executor.map(function, *iterables):
+            pass
+
+
+def hide_parallel(ph, workers = None, chunk_bytes = DEFAULT_CHUNK_BYTES, block_bytes = 2 ** 20):
+    """
+    Generate the key of the payload of ph by ranges in a
+    pool of processes. Payloads mapped from a file are mapped
+    again by every worker, the rest are shared in memory, and
+    every worker writes the characters of its ranges into a
+    shared key buffer, so no array is pickled.
+
+    :param ph: ParagraphsHiding with the cover text and the payload.
+    :param workers: optional, processes generating the key, all the cores by default.
+    :param chunk_bytes: optional, bytes of the payload hidden by every task.
+    :param block_bytes: optional, bytes unpacked each time by a task.
+    :return: str with the key, the same hide_information gives.
+    """
+    check_workers(workers)
+    payload = ph.byte_array_to_hide
+    chunk_bytes = max(ph.symbol_bits, chunk_bytes - chunk_bytes % ph.symbol_bits)
+    starts = range(0, payload.size, chunk_bytes)
+    workers = _workers(workers)
+
+    if workers == 1 or len(starts) < 2 or ph.words_count == 0:
+        return ph.hide_range(block_bytes = block_bytes)
+
+    key_format = _key_format(ph)
+    key_chars = -(-payload.size * 8 // ph.symbol_bits)
+    memories = []
+    try:
+        if isinstance(payload, np.memmap) and payload.filename is not None and payload.offset == 0:
+            shared_payload = ("file", payload.filename)
+        else:
+            memory = shared_memory.SharedMemory(create=True, size=payload.size)
+            memories.append(memory)
+            np.ndarray(payload.shape, dtype = "uint8", buffer = memory.buf)[:] = payload
+            shared_payload = ("memory", memory.name, payload.size)
+
+        memory = shared_memory.SharedMemory(create=True, size=key_chars * np.dtype(key_format[1]).itemsize)
+        memories.append(memory)
+
+        _run(_hide_chunk, workers, (_template(ph), shared_payload, (memory.name, key_chars, 0), key_format),
+             starts, [start + chunk_bytes for start in starts], [block_bytes] * len(starts))
+
+        return str(memory.buf[:key_chars * np.dtype(key_format[1]).itemsize], key_format[0])
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+
+def unhide_parallel(ph, output, start = 0, workers = None, chunk_chars = DEFAULT_CHUNK_BYTES * 8,
+                    block_chars = 2 ** 20):
+    """
+    Decode the key of ph from character start to its end
+    by ranges in a pool of processes. The key is copied once
+    to shared memory and every worker writes the bytes of its
+    ranges into the output file, mapped with its final size.
+
+    :param ph: ParagraphsHiding with the cover text and the key.
+    :param output: path of the output file, already of ph.unhidden_size() bytes.
+    :param start: optional, first character to decode, a multiple of 8.
+    :param workers: optional, processes decoding the key, all the cores by default.
+    :param chunk_chars: optional, key characters decoded by every task, a multiple of 8.
+    :param block_chars: optional, key characters decoded each time by a task.
+    """
+    check_workers(workers)
+    chunk_chars = max(8, chunk_chars - chunk_chars % 8)
+    key_format = _key_format(ph)
+    key_chars = len(ph.key) - start
+    if key_chars <= 0:
+        return
+
+    memory = shared_memory.SharedMemory(create=True, size=key_chars * np.dtype(key_format[1]).itemsize)
+    try:
+        key = np.ndarray((key_chars,), dtype = key_format[1], buffer = memory.buf)
+        # copied by blocks, a character that does not fit is not from the cover text
+        for block in range(0, key_chars, block_chars):
+            fragment = ph.key[start + block:start + block + block_chars]
+            try:
+                codes = np.frombuffer(fragment.encode(key_format[0]), dtype = key_format[1])
+            except UnicodeEncodeError as uee:
+                raise InvalidCharacter("Character mismatch in word %c at position %d"
+                                       % (uee.object[uee.start], start + block + uee.start))
+            key[block:block + codes.size] = codes
+        del key
+
+        starts = range(start, len(ph.key), chunk_chars)
+        _run(_unhide_chunk, _workers(workers),
+             (_template(ph), None, (memory.name, key_chars, start), key_format, output),
+             starts, [position + chunk_chars for position in starts], [block_chars] * len(starts))
+    finally:
+        memory.close()
+        memory.unlink()
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: planner.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Pre-flight sizing of the covers needed to hide a payload """
+
+import random
+import numpy as np
+
+import crawler
+import text_stego as stego
+from extractors import ExtractionError
+from key_packing import packed_overhead, deflate_bound
+
+
+# bits taken in the image by every hidden character
+BITS_PER_CHAR = 9
+
+# alphabet assumed for packed keys before knowing the cover
+DEFAULT_ALPHABET_SIZE = 256
+
+
+class CapacityError(Exception):
+    """ No cover found big enough for a payload """
+    pass
+
+
+class CapacityPlan():
+    """
+    Capacity needed to hide a payload, computed from its size
+    before any cover is fetched. The key has a character per
+    symbol_bits payload bits, and every hidden character (a key
+    character or a byte of a packed key) takes 9 bits of the image.
+    """
+
+    def __init__(self, payload_size, lsb_bits = 1, use_alpha = False, packed_key = False, compress_key = False,
+                 min_words = 1, symbol_bits = 1):
+        """
+        Constructor of the class CapacityPlan.
+
+        :param payload_size: int with the bytes of the payload.
+        :param lsb_bits: optional, number of LSBs used from every channel.
+        :param use_alpha: optional, use also the alpha channel.
+        :param packed_key: optional, the key is hidden packed.
+        :param compress_key: optional, the packed key is deflated.
+        :param min_words: optional, minimum number of clean words of the cover text.
+        :param symbol_bits: optional, bits carried by every key character, 0 (the most
+                            the cover allows) is sized as the worst case of 1.
+        """
+        self.payload_size = payload_size
+        self.lsb_bits = lsb_bits
+        self.use_alpha = use_alpha
+        self.packed_key = packed_key or compress_key
+        self.compress_key = compress_key
+        self.min_words = min_words
+        self.symbol_bits = symbol_bits
+
+        self.key_length = -(-payload_size * 8 // max(1, symbol_bits))
+
+    def hidden_chars(self, alphabet_size = DEFAULT_ALPHABET_SIZE):
+        """
+        Upper bound of the characters hidden in the image.
+
+        :param alphabet_size: optional, distinct letters of the cover, bounds packed keys.
+        :return: int
+        """
+        if not self.packed_key:
+            return self.key_length
+
+        bits_per_symbol = max(1, (alphabet_size - 1).bit_length())
+        body = -(-self.key_length * bits_per_symbol // 8)
+        if self.compress_key:
+            body = deflate_bound(body)
+
+        return packed_overhead(alphabet_size) + body
+
+    def required_pixels(self, alphabet_size = DEFAULT_ALPHABET_SIZE):
+        """
+        Pixels of the cover image needed by the payload.
+
+        :param alphabet_size: optional, distinct letters of the cover, bounds packed keys.
+        :return: int
+        """
+        bits_per_pixel = (4 if self.use_alpha else 3) * self.lsb_bits
+
+        return -(-self.hidden_chars(alphabet_size) * BITS_PER_CHAR // bits_per_pixel)
+
+    def check(self, image, ph):
+        """
+        Check if a cover is big enough for the payload.
+
+        :param image: PIL image of the cover.
+        :param ph: ParagraphsHiding with the cover text.
+        :return: str with the reason the cover is not valid, empty if it is.
+        """
+        if ph.words_count < self.min_words:
+            return "cover text has %d clean words, %d needed" % (ph.words_count, self.min_words)
+        if self.symbol_bits > 1 and ph.max_symbol_bits() < self.symbol_bits:
+            return "cover text allows %d bits per key character, %d needed" % (ph.max_symbol_bits(),
+                                                                                self.symbol_bits)
+
+        # stego images are saved as PNG, which has no CMYK
+        if image.mode not in ('RGB', 'RGBA'):
+            return "cover image mode %s not supported" % (image.mode)
+        if self.use_alpha and image.mode != 'RGBA':
+            return "cover image has no alpha channel"
+
+        alphabet_size = DEFAULT_ALPHABET_SIZE
+        if self.packed_key and ph.words_count > 0:
+            alphabet_size = np.union1d(ph.first_letters, ph.last_letters).size
+
+        pixels = image.size[0] * image.size[1]
+        needed = self.required_pixels(alphabet_size)
+        if pixels < needed:
+            return "cover image has %d pixels, %d needed" % (pixels, needed)
+
+        return ''
+
+    def report(self):
+        """ Needed capacity, to add to the results of a run """
+        return {"payload_bytes": self.payload_size, "key_length": self.key_length,
+                "hidden_chars": self.hidden_chars(), "required_pixels": self.required_pixels()}
+
+
+def select_cover(plan, languages, rnd = random, attempts = 5):
+    """
+    Fetch random covers until one is big enough for the plan,
+    corpus covers are chosen among the ones whose image is big
+    enough for any alphabet.
+
+    :param plan: CapacityPlan of the payload.
+    :param languages: list with the languages where to choose the sources from.
+    :param rnd: optional, random.Random to make the choice reproducible.
+    :param attempts: optional, covers to fetch before giving up.
+    :return: Cover and ParagraphsHiding with its text already cleaned.
+    """
+    reason = ''
+
+    for _ in range(attempts):
+        source = crawler.SourceFinding(source_language=rnd.choice(languages))
+        try:
+            cover = source.generate(min_pixels=plan.required_pixels())
+        except (ExtractionError, OSError) as e:
+            # no document of the source big enough, or an image that can not be decoded
+            reason = str(e)
+            continue
+
+        ph = stego.ParagraphsHiding(text_where_to_hide=cover.text, cover_index=cover.cover_index,
+                                    symbol_bits=plan.symbol_bits)
+        reason = plan.check(cover.image, ph)
+        if reason == '':
+            return cover, ph
+
+    raise CapacityError("no cover of %d pixels found after %d attempts, last one: %s"
+                        % (plan.required_pixels(), attempts, reason))
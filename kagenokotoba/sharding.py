@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: sharding.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" Keys split across several cover images, hidden and recovered in parallel """
+
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import text_stego as stego
+from key_packing import packed_overhead, deflate_bound
+
+
+class ShardError(Exception):
+    """ Shards missing, repeated or from different keys """
+    pass
+
+
+def key_id(key):
+    """ Identifier shared by all the shards of a key """
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def shard_capacity(image, lsb_bits = 1, use_alpha = False, packed_key = False, compress_key = False):
+    """
+    Key characters that fit in an image.
+
+    :param image: PIL image.
+    :param lsb_bits: optional, number of LSBs used from every channel.
+    :param use_alpha: optional, use also the alpha channel.
+    :param packed_key: optional, room is left for the header of a packed key.
+    :param compress_key: optional, room is left also for the expansion of deflate.
+    :return: int
+    """
+    used_channels = 4 if use_alpha else 3
+    capacity = image.size[0] * image.size[1] * used_channels * lsb_bits // 9
+
+    if packed_key or compress_key:
+        # packed symbols never take more than a byte, the header and
+        # an alphabet of up to 256 letters are on top
+        capacity -= packed_overhead(256)
+    if compress_key and capacity > 0:
+        # deflate may grow the symbols, the growth of the whole room is an upper bound
+        capacity -= deflate_bound(capacity) - capacity
+
+    return max(0, capacity)
+
+
+def split_key(key, capacities):
+    """
+    Split a key in consecutive shards, proportional to the
+    capacity of every image so they take the same time.
+
+    :param key: str with the key.
+    :param capacities: list with the key characters that fit in every image.
+    :return: list with a str per image, some may be empty.
+    """
+    total = sum(capacities)
+    if len(key) > total:
+        raise ValueError('data is too large for images')
+
+    shards = []
+    start = 0
+    taken = 0
+    for capacity in capacities:
+        taken += capacity
+        end = min(len(key), -(-len(key) * taken // total))
+        shards.append(key[start:end])
+        start = end
+
+    return shards
+
+
+def _hide_shard(image, output, key_to_hide, options):
+    ih = stego.ImageHiding(image, key_to_hide=key_to_hide, **options)
+
+    return ih.hide_information(output)
+
+
+def _unhide_shard(image):
+    uh = stego.ImageHiding(image)
+    shard = uh.recover_shard()
+    key, url, language = uh.unhide_information()
+
+    return shard, key, url, language, (uh.recover_text_hash(), uh.recover_symbol_bits())
+
+
+def _map(function, workers, *iterables):
+    """ Map in a pool of processes, in this process with 1 worker """
+    if workers == 1:
+        return list(map(function, *iterables))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *iterables))
+
+
+def hide_shards(key, images, outputs, url_metadata = '', url_language = '', packed_key = False,
+                compress_key = False, lsb_bits = 1, use_alpha = False, text_hash = '', symbol_bits = 1,
+                file_type = '', compress_level = 6, workers = None):
+    """
+    Hide a key split across several images, every shard
+    records its position, the number of shards and the id
+    of the whole key in its PNG text chunks.
+
+    :param key: str with the key generated by ParagraphsHiding.
+    :param images: list of paths, bytes or PIL images where to hide the shards.
+    :param outputs: list of paths where to save the stego images.
+    :param workers: optional, processes hiding the shards, all the cores by default.
+    :return: list with the outputs used, images without shard are left out.
+    """
+    if len(images) != len(outputs):
+        raise ValueError('an output is needed for every image')
+
+    packed_key = packed_key or compress_key
+    opened = [stego.ImageHiding(image, lsb_bits=lsb_bits, use_alpha=use_alpha).image_object for image in images]
+    shards = split_key(key, [shard_capacity(image, lsb_bits, use_alpha, packed_key, compress_key)
+                             for image in opened])
+
+    # images left without characters are not needed
+    used = [i for i, shard in enumerate(shards) if shard != '']
+    count = len(used)
+    identifier = key_id(key)
+
+    options = [{"url_metadata": url_metadata, "url_language": url_language, "packed_key": packed_key,
+                "compress_key": compress_key, "lsb_bits": lsb_bits, "use_alpha": use_alpha,
+                "text_hash": text_hash, "symbol_bits": symbol_bits, "file_type": file_type,
+                "compress_level": compress_level, "shard": (index, count, identifier)}
+               for index in range(count)]
+
+    return _map(_hide_shard, workers, [images[i] for i in used], [outputs[i] for i in used],
+                [shards[i] for i in used], options)
+
+
+def unhide_shards(images, workers = None):
+    """
+    Recover a key hidden with hide_shards, the images may
+    be given in any order but all the shards are needed.
+
+    :param images: list of paths, bytes or PIL images with the shards.
+    :param workers: optional, processes extracting the shards, all the cores by default.
+    :return: str with the key, str with the url, str with the language and str with the text hash
+    """
+    if not images:
+        raise ShardError("no shards given")
+
+    found = sorted(_map(_unhide_shard, workers, images), key=lambda result: (result[0] or (0,))[0])
+
+    if any(shard is None for shard, *_ in found):
+        raise ShardError("image without shard metadata")
+
+    count = found[0][0][1]
+    identifier = found[0][0][2]
+    if any(shard[1] != count or shard[2] != identifier for shard, *_ in found):
+        raise ShardError("shards from different keys")
+
+    indexes = [shard[0] for shard, *_ in found]
+    if indexes != list(range(count)):
+        missing = sorted(set(range(count)) - set(indexes))
+        if missing:
+            raise ShardError("missing shards %s of %d" % (", ".join(str(i) for i in missing), count))
+        raise ShardError("repeated shards")
+
+    if len(set((url, language, cover) for _, _, url, language, cover in found)) != 1:
+        raise ShardError("shards from different cover texts")
+
+    key = "".join(shard_key for _, shard_key, _, _, _ in found)
+    if identifier != '' and key_id(key) != identifier:
+        raise ShardError("reassembled key does not match its id")
+
+    _, _, url, language, (text_hash, _) = found[0]
+    return key, url, language, text_hash
@@ -15,13 +15,15 @@ File: text_stego.py
 """ Implementation of the algorithms for other parts of the tool """
 
 
-##########IMPORTANT NOTE##########
-##Libmagic dependencies must be installed on system
-##-Check https://pypi.org/project/python-magic/ for more information
-import string, mimetypes, magic, os
+import string, os
 import numpy as np
 from PIL import Image
-from PIL.PngImagePlugin import PngImageFile, PngInfo
+from PIL.PngImagePlugin import PngInfo
+from io import BytesIO
+
+from key_packing import is_packed_key, pack_key, unpack_key
+import file_types
+import instrumentation
 
 
 class NotValidTextException(Exception):
@@ -39,7 +41,8 @@ class InvalidCharacter(Exception):
 class ParagraphsHiding():
     """ Approach based on key to hide a message inside of a given text (based on point 3.3 of [Agarwal, 2013]) """
 
-    def __init__(self, file_where_to_hide, file_to_hide = '', key = '', file_to_unhide = ''):
+    def __init__(self, file_where_to_hide = '', file_to_hide = '', key = '', file_to_unhide = '', cover_index = None,
+                 text_where_to_hide = None, data_to_hide = None, symbol_bits = 1):
         """
         Constructor of the class ParagraphsHiding,
         we will assign variables and clean words
@@ -49,26 +52,65 @@ class ParagraphsHiding():
         :param file_to_hide: optional, file with the information to hide.
         :param key: optional, string with the key to use for unhidding.
         :param file_to_unhide: optional, file where to write unhidden information.
+        :param cover_index: optional, CoverIndex where to reuse the words of known texts,
+                            clean_words is only filled when the text is not indexed yet.
+        :param text_where_to_hide: optional, str or bytes with the text, instead of file_where_to_hide.
+        :param data_to_hide: optional, bytes with the information to hide, instead of file_to_hide.
+        :param symbol_bits: optional, bits carried by every key character, 1 for the original scheme
+                            and 0 for the most the cover text allows (see max_symbol_bits).
         """
         self.file_where_to_hide = file_where_to_hide
-        self.file_to_hide = file_to_hide
         self.file_to_unhide = file_to_unhide
         self.key = key
+        self.cover_index = cover_index
         self.text = ""
         self.clean_words = []
+        self.words_count = 0
+        self.first_letters = None
+        self.last_letters = None
+        self.symbol_bits = symbol_bits
+        self.letter_classes = None
+        self.word_offsets = None
+
+        if text_where_to_hide is not None:
+            if isinstance(text_where_to_hide, bytes):
+                text_where_to_hide = text_where_to_hide.decode("utf-8")
+            self.text = text_where_to_hide
+        elif not os.path.exists(file_where_to_hide):
+            raise FileNotFoundError("%s file where to hide does not exists" % (file_where_to_hide))
 
-        self.byte_array_to_hide = None
+        self.set_data_to_hide(file_to_hide, data_to_hide)
 
-        if not os.path.exists(file_where_to_hide):
-            raise FileNotFoundError("%s file where to hide does not exists" % (file_where_to_hide))
+        with instrumentation.stage("clean_words"):
+            self.__clean_words()
+
+        if self.symbol_bits == 0:
+            self.symbol_bits = self.max_symbol_bits()
+        if self.symbol_bits < 1 or self.symbol_bits > 8:
+            raise ValueError("symbol_bits must be between 1 and 8")
+
+    def set_data_to_hide(self, file_to_hide = '', data_to_hide = None):
+        """
+        Change the information to hide, so the same cleaned
+        text can hide several files.
+
+        :param file_to_hide: optional, file with the information to hide.
+        :param data_to_hide: optional, bytes with the information to hide, instead of file_to_hide.
+        """
+        self.file_to_hide = file_to_hide
+        self.byte_array_to_hide = None
 
-        if file_to_hide != '':
+        if data_to_hide is not None:
+            self.byte_array_to_hide = np.frombuffer(data_to_hide, dtype = "uint8")
+        elif file_to_hide != '':
             if not os.path.exists(file_to_hide):
                 raise FileNotFoundError("%s file to hide does not exists" % (file_to_hide))
-            self.byte_array_to_hide = np.fromfile(self.file_to_hide, dtype = "uint8")
-        
-
-        self.__clean_words()
+            if os.path.getsize(file_to_hide) == 0:
+                # empty files can not be mapped
+                self.byte_array_to_hide = np.zeros(0, dtype = "uint8")
+            else:
+                # mapped, the payload is only read by blocks when hiding
+                self.byte_array_to_hide = np.memmap(self.file_to_hide, dtype = "uint8", mode = "r")
 
     def __clean_words(self):
         """
@@ -77,8 +119,17 @@ class ParagraphsHiding():
         are 'alpha' words without numbers. It also
         removes non ascii characters
         """
-        with open(self.file_where_to_hide,'r') as file_:
-            self.text = file_.read()
+        if self.file_where_to_hide != '' and self.text == "":
+            with open(self.file_where_to_hide,'r') as file_:
+                self.text = file_.read()
+
+        if self.cover_index is not None:
+            text_hash = self.cover_index.text_hash(self.text)
+            letters = self.cover_index.load(text_hash)
+            if letters is not None:
+                self.first_letters, self.last_letters = letters
+                self.words_count = self.first_letters.size
+                return
 
         # first remove punctuation marks on text
         clean_text = self.text.translate(str.maketrans(
@@ -92,134 +143,545 @@ class ParagraphsHiding():
         self.clean_words = [
             i for i in clean_text.split() if len(i) > 1 and i.isalpha() and i[0] != i[-1]]
 
+        self.__index_letters()
+
+        if self.cover_index is not None:
+            self.cover_index.store(text_hash, self.first_letters, self.last_letters)
+
+    def __index_letters(self):
+        """
+        Internal method to precompute the code points
+        of the first and the last letter of every clean
+        word, so key generation and recovery can work
+        over whole arrays instead of word by word.
+        """
+        self.first_letters = np.array([ord(word[0]) for word in self.clean_words], dtype = "uint32")
+        self.last_letters = np.array([ord(word[-1]) for word in self.clean_words], dtype = "uint32")
+        self.words_count = len(self.clean_words)
+
+
+    def __index_classes(self):
+        """
+        Internal method to build the letter classes used
+        when key characters carry several bits: the sorted
+        letters starting or ending the clean words, and for
+        every word an offset given by the classes of its
+        first and last letters.
+        """
+        if self.letter_classes is not None:
+            return
+
+        self.letter_classes = np.union1d(self.first_letters, self.last_letters).astype("uint32")
+        classes = max(1, self.letter_classes.size)
+        self.word_offsets = ((np.searchsorted(self.letter_classes, self.first_letters) +
+                              np.searchsorted(self.letter_classes, self.last_letters)) % classes).astype("uint32")
+
+    def max_symbol_bits(self):
+        """
+        Get the most bits a key character can carry with
+        this cover text, limited by its letter classes.
+
+        :return: int between 1 and 8
+        """
+        self.__index_classes()
+
+        return min(8, max(1, self.letter_classes.size.bit_length() - 1))
+
+    def __tile_offsets(self, start_word, length):
+        """
+        Internal method to get the offsets of the words used
+        by `length` consecutive key positions, as __tile_letters.
+
+        :return: numpy array with the offsets.
+        """
+        if length > 0 and self.words_count == 0:
+            raise NotValidTextException("no valid words in %s" % (self.file_where_to_hide))
+
+        self.__index_classes()
+        if (1 << self.symbol_bits) > self.letter_classes.size:
+            raise NotValidTextException("%d letter classes in the text, %d needed for %d bits per character"
+                                        % (self.letter_classes.size, 1 << self.symbol_bits, self.symbol_bits))
+
+        return np.resize(np.roll(self.word_offsets, -start_word), length)
+
+    def __tile_letters(self, start_word, length):
+        """
+        Internal method to get the first and last letters
+        of the words used by `length` consecutive key
+        positions, starting at word `start_word` and
+        going through the text in a cyclic way.
+
+        :return: tuple with first and last letters arrays.
+        """
+        if length > 0 and self.words_count == 0:
+            raise NotValidTextException("no valid words in %s" % (self.file_where_to_hide))
+
+        first_letters = np.resize(np.roll(self.first_letters, -start_word), length)
+        last_letters = np.resize(np.roll(self.last_letters, -start_word), length)
+
+        return first_letters, last_letters
+
+    def __encode_bits(self, bits, start_word = 0):
+        """
+        Internal method to turn an array of bits into
+        key characters, bit i goes to word
+        (start_word + i) % words_count.
+
+        :return: str with the key fragment.
+        """
+        if self.symbol_bits > 1:
+            return self.__encode_symbols(bits, start_word)
+
+        first_letters, last_letters = self.__tile_letters(start_word, bits.size)
 
-    def hide_information(self):
+        # 1 is encoded with the first letter of the word and 0 with the last one
+        key_codes = np.where(bits == 1, first_letters, last_letters).astype("<u4")
+
+        return key_codes.tobytes().decode("utf-32-le")
+
+    def __decode_key(self, key, start_word = 0, start_position = 0):
+        """
+        Internal method to turn key characters into an
+        array of bits, character i comes from word
+        (start_word + i) % words_count.
+
+        :param start_position: position of key[0] in the whole key, used on errors.
+        :return: numpy array of bits.
+        """
+        if self.symbol_bits > 1:
+            return self.__decode_symbols(key, start_word, start_position)
+
+        key_codes = np.frombuffer(key.encode("utf-32-le"), dtype = "<u4")
+        first_letters, last_letters = self.__tile_letters(start_word, key_codes.size)
+
+        bits = key_codes == first_letters
+        valid = bits | (key_codes == last_letters)
+
+        if not valid.all():
+            index = int(np.argmin(valid))
+            raise InvalidCharacter("Character mismatch in word %c at position %d" % (key[index], start_position + index))
+
+        return bits.astype("uint8")
+
+    def __encode_symbols(self, bits, start_word = 0):
+        """
+        Internal method to turn an array of bits into key
+        characters carrying symbol_bits bits each, the last
+        one padded with zeros. The value v of character i is
+        written as the letter class (v + offset) % classes,
+        where offset is the one of word (start_word + i) % words_count.
+
+        :return: str with the key fragment.
+        """
+        bits = np.concatenate((bits, np.zeros(-bits.size % self.symbol_bits, dtype = "uint8")))
+        weights = 1 << np.arange(self.symbol_bits - 1, -1, -1, dtype = "uint32")
+        values = bits.reshape(-1, self.symbol_bits).astype("uint32") @ weights
+
+        offsets = self.__tile_offsets(start_word, values.size)
+        key_codes = self.letter_classes[(values + offsets) % self.letter_classes.size].astype("<u4")
+
+        return key_codes.tobytes().decode("utf-32-le")
+
+    def __decode_symbols(self, key, start_word = 0, start_position = 0):
+        """
+        Internal method to turn key characters carrying
+        symbol_bits bits each into an array of bits, the
+        padding of the last character is kept.
+
+        :param start_position: position of key[0] in the whole key, used on errors.
+        :return: numpy array of bits.
+        """
+        key_codes = np.frombuffer(key.encode("utf-32-le"), dtype = "<u4")
+        offsets = self.__tile_offsets(start_word, key_codes.size)
+
+        classes = np.minimum(np.searchsorted(self.letter_classes, key_codes), self.letter_classes.size - 1)
+        values = (classes.astype("int64") - offsets) % self.letter_classes.size
+
+        valid = (self.letter_classes[classes] == key_codes) & (values < (1 << self.symbol_bits))
+        if not valid.all():
+            index = int(np.argmin(valid))
+            raise InvalidCharacter("Character mismatch in word %c at position %d" % (key[index], start_position + index))
+
+        shifts = np.arange(self.symbol_bits - 1, -1, -1)
+
+        return ((values[:, None] >> shifts) & 1).astype("uint8").ravel()
+
+    def hide_range(self, start = 0, stop = None, block_bytes = 2 ** 20):
+        """
+        Method to get the fragment of the key hiding the
+        bytes [start, stop) of the message. Any range can be
+        hidden on its own, the word of its first character
+        follows from start. The range is unpacked by blocks,
+        so only the bits of one block are in memory at a time.
+
+        :param start: optional, first byte of the range, a multiple of symbol_bits.
+        :param stop: optional, end of the range, the end of the message by default.
+        :param block_bytes: optional, bytes of the message encoded each time.
+        :return: str with the key fragment.
+        """
+        if start % self.symbol_bits != 0:
+            raise ValueError("range must start at a multiple of %d bytes" % (self.symbol_bits))
+
+        payload = self.byte_array_to_hide
+        stop = payload.size if stop is None else min(stop, payload.size)
+
+        # blocks must fill whole characters, only the last one is padded
+        block_bytes = max(self.symbol_bits, block_bytes - block_bytes % self.symbol_bits)
+        fragments = []
+        index_word = start * 8 // self.symbol_bits % max(1, self.words_count)
+        for block in range(start, stop, block_bytes):
+            key = self.__encode_bits(np.unpackbits(payload[block:min(stop, block + block_bytes)]), index_word)
+            fragments.append(key)
+            index_word = (index_word + len(key)) % self.words_count
+
+        return "".join(fragments)
+
+    def hide_information(self, block_bytes = 2 ** 20, workers = 1):
         """
         Method to get a key derived from hiding
         the given message into the given text.
 
+        :param block_bytes: optional, bytes of the message encoded each time.
+        :param workers: optional, processes generating the key, all the cores with None.
         :return: str with generated key.
         """
-        index_word = 0
-        key = ""
-        # go through the hole message
-        for bit in np.unpackbits(self.byte_array_to_hide):
-            if bit == 0:
-                key += self.clean_words[index_word][-1]
-            elif bit == 1:
-                key += self.clean_words[index_word][0]
-            else:
-                raise InvalidBitValue("hide_information: (numpy.unpackbits) Unknown value for bit %d" % (bit))
+        payload = self.byte_array_to_hide
+        instrumentation.count("payload_bytes", payload.size)
+        instrumentation.count("key_chars", -(-payload.size * 8 // self.symbol_bits))
+
+        try:
+            with instrumentation.stage("key_generation"):
+                if workers != 1:
+                    import parallel
+                    return parallel.hide_parallel(self, workers, block_bytes = block_bytes)
+                return self.hide_range(block_bytes = block_bytes)
+        except NotValidTextException as nvt:
+            raise NotValidTextException("hide_information: %s" % (str(nvt)))
+
+    def unhidden_size(self):
+        """
+        Get the bytes recovered from the key, known before
+        decoding it: a byte every 8 bits, the zero padding
+        of a 1 bit key fills a last byte and the padding of
+        the last character of a multi-bit key is dropped.
 
-            index_word += 1
-            # use text where to hide a cyclic way
-            if index_word == len(self.clean_words):
-                index_word = 0
-        
-        return key
+        :return: int
+        """
+        if self.symbol_bits == 1:
+            return -(-len(self.key) // 8)
 
-    def unhide_information(self):
+        return len(self.key) * self.symbol_bits // 8
+
+    def unhide_range(self, key, position = 0, block_chars = 2 ** 20):
+        """
+        Method to decode a fragment of the key by blocks
+        of characters, a multiple of 8 so every block but
+        the last one of the key gives whole bytes. Any
+        fragment can be decoded on its own, the word of
+        its first character follows from its position.
+
+        :param key: str with the fragment of the key.
+        :param position: optional, position of key[0] in the whole key, a multiple of 8.
+        :param block_chars: optional, key characters decoded each time.
+        :return: generator of numpy arrays with the bytes of every block.
+        """
+        if position % 8 != 0:
+            raise ValueError("fragment must start at a multiple of 8 characters")
+
+        block_chars = max(8, block_chars - block_chars % 8)
+        for start in range(0, len(key), block_chars):
+            block = position + start
+            bits = self.__decode_key(key[start:start + block_chars], block % max(1, self.words_count), block)
+            if self.symbol_bits > 1:
+                # the padding of the last character is less than a byte
+                bits = bits[:bits.size - bits.size % 8]
+
+            yield np.packbits(bits)
+
+    def unhide_information(self, file_type = '', block_chars = 2 ** 20, workers = 1):
         """
         Method to extract the information from the
         given text, using the key to know which
-        information to extract.
+        information to extract. The output file is
+        mapped with its final size and every block
+        of the key is written into it once decoded.
 
+        :param file_type: optional, mime type recorded when hiding, detected from the content if not given.
+        :param block_chars: optional, key characters decoded each time.
+        :param workers: optional, processes decoding the key, all the cores with None.
         :return: str with extracted filename
         """
+        if workers != 1:
+            # checked before creating the output file
+            import parallel
+            parallel.check_workers(workers)
+
+        block_chars = max(8, block_chars - block_chars % 8)
+        size = self.unhidden_size()
+        blocks = self.unhide_range(self.key, 0, block_chars)
+
+        try:
+            with instrumentation.stage("key_decode"):
+                # the first block is decoded before creating the file, a bad key leaves nothing behind
+                first_block = next(blocks, np.zeros(0, dtype = "uint8"))
+
+            if file_type == '':
+                with instrumentation.stage("file_type"):
+                    file_type = file_types.guess_type(first_block[:file_types.HEADER_SIZE])
+
+            f_name = "{}{}".format(self.file_to_unhide, file_types.extension(file_type))
+
+            with open(f_name,'wb') as file_:
+                file_.truncate(size)
+            if size == 0:
+                return f_name
+
+            try:
+                file_content = np.memmap(f_name, dtype = "uint8", mode = "r+", shape = (size,))
+                file_content[:first_block.size] = first_block
+                written = first_block.size
+                with instrumentation.stage("key_decode"):
+                    if workers != 1 and len(self.key) > block_chars:
+                        # the rest of the key is decoded by ranges in other processes
+                        blocks.close()
+                        parallel.unhide_parallel(self, f_name, block_chars, workers, block_chars = block_chars)
+                    for block in blocks:
+                        file_content[written:written + block.size] = block
+                        written += block.size
+                with instrumentation.stage("payload_write"):
+                    file_content.flush()
+                del file_content
+            except (NotValidTextException, InvalidCharacter):
+                os.remove(f_name)
+                raise
+        except NotValidTextException as nvt:
+            raise NotValidTextException("unhide_information: %s" % (str(nvt)))
+        except InvalidCharacter as ic:
+            raise InvalidCharacter("unhide_information: %s" % (str(ic)))
+
+        instrumentation.count("payload_bytes", size)
+
+        return f_name
+
+    def hide_stream(self, stream_to_hide, key_sink, chunk_size = 1024 * 1024):
+        """
+        Method to hide a message read from a binary
+        stream, writing the key by fragments into a
+        text sink. Only one chunk of the message is
+        kept in memory at a time.
+
+        :param stream_to_hide: binary file-like object with the information to hide.
+        :param key_sink: text file-like object where to write the key.
+        :param chunk_size: optional, number of bytes read from the stream each time.
+        :return: int with the number of key characters written.
+        """
+        # word cursor carried between chunks to keep the cyclic scheme
         index_word = 0
+        written = 0
+        # chunks must fill whole characters, only the last one is padded
+        chunk_size = max(self.symbol_bits, chunk_size - chunk_size % self.symbol_bits)
 
-        bits_list = []
-        
-        for c in self.key:
-            if c == self.clean_words[index_word][0]:
-                bits_list.append(1)
-            elif c == self.clean_words[index_word][-1]:
-                bits_list.append(0)
-            else:
-                raise InvalidCharacter("unhide_information: Character mismatch in word %c" % (c))
+        while True:
+            chunk = stream_to_hide.read(chunk_size)
+            if not chunk:
+                break
 
-            index_word += 1
-            # use text where to unhide a cyclic way
-            if index_word == len(self.clean_words):
-                index_word = 0
+            bits = np.unpackbits(np.frombuffer(chunk, dtype = "uint8"))
+            try:
+                key = self.__encode_bits(bits, index_word)
+            except NotValidTextException as nvt:
+                raise NotValidTextException("hide_stream: %s" % (str(nvt)))
+            key_sink.write(key)
 
-        file_content = np.packbits(bits_list)
-        
-        mime = magic.from_buffer(file_content.tostring(), mime=True)
-        if mime == 'text/plain': 
-            extension = '.txt'
-        else:
-            extension = mimetypes.guess_extension(mime)
+            written += len(key)
+            index_word = (index_word + len(key)) % self.words_count
 
-        f_name = "{}{}".format(self.file_to_unhide, extension)
+        return written
 
-        with open(f_name,'wb') as file_:
-            file_content = np.packbits(bits_list)
-            file_content.tofile(file_)
+    def unhide_stream(self, key_stream, sink_to_unhide, chunk_size = 1024 * 1024):
+        """
+        Method to extract a message from a key read
+        from a text stream, writing the recovered bytes
+        into a binary sink as they are decoded. Only one
+        chunk of the key is kept in memory at a time.
+
+        :param key_stream: text file-like object with the key.
+        :param sink_to_unhide: binary file-like object where to write the information.
+        :param chunk_size: optional, number of bytes recovered each time.
+        :return: int with the number of bytes written.
+        """
+        # word cursor carried between chunks to keep the cyclic scheme
+        index_word = 0
+        position = 0
+        written = 0
+        # bits from a key fragment that do not fill a whole byte yet
+        pending_bits = np.zeros(0, dtype = "uint8")
 
-        return f_name
+        while True:
+            key = key_stream.read(chunk_size * 8)
+            if not key:
+                break
+
+            try:
+                bits = self.__decode_key(key, index_word, position)
+            except NotValidTextException as nvt:
+                raise NotValidTextException("unhide_stream: %s" % (str(nvt)))
+            except InvalidCharacter as ic:
+                raise InvalidCharacter("unhide_stream: %s" % (str(ic)))
+
+            position += len(key)
+            index_word = (index_word + len(key)) % self.words_count
+
+            bits = np.concatenate((pending_bits, bits))
+            whole = bits.size - bits.size % 8
+            sink_to_unhide.write(np.packbits(bits[:whole]).tobytes())
+            written += whole // 8
+            pending_bits = bits[whole:]
+
+        if pending_bits.size > 0 and self.symbol_bits == 1:
+            # same zero padding np.packbits applies to a whole key
+            sink_to_unhide.write(np.packbits(pending_bits).tobytes())
+            written += 1
+
+        return written
 
 class ImageHiding():
     """ Approach based on RGB pixel values to hide text data across an Image """
 
-    def __init__(self, image_where_to_hide, key_to_hide = '', url_metadata = '', url_language = ''):
+    def __init__(self, image_where_to_hide, key_to_hide = '', url_metadata = '', url_language = '',
+                 packed_key = False, compress_key = False, lsb_bits = 1, use_alpha = False, text_hash = '',
+                 shard = None, symbol_bits = 1, file_type = '', compress_level = 6):
         """
         Constructor of the class ImageHiding.
         If key is provided, it will be hidden into the image,
         either way it will be recovered.
 
-        :param image_where_to_hide: image where to hide the information.
+        :param image_where_to_hide: path, bytes of an image file or PIL image where to hide the information.
         :param key_to_hide: optional, key to hide into the image.
+        :param packed_key: optional, hide the key with the compact binary format.
+        :param compress_key: optional, deflate the packed key before hiding it.
+        :param lsb_bits: optional, number of LSBs (1 to 4) used from every channel.
+        :param use_alpha: optional, use also the alpha channel of RGBA images.
+        :param text_hash: optional, hash of the cover text to detect changes of the source page.
+        :param shard: optional, tuple with index, count and id of the whole key when the key is a shard of it.
+        :param symbol_bits: optional, bits carried by every character of the key (see ParagraphsHiding).
+        :param file_type: optional, mime type of the hidden file, so it is not detected when unhiding.
+        :param compress_level: optional, zlib level (0 to 9) of the saved PNG, lower saves faster but bigger.
         """
         self.image_where_to_hide = image_where_to_hide
         self.key_to_hide = key_to_hide
         self.url_metadata = url_metadata
         self.url_language = url_language
-
-        if self.image_where_to_hide != '':
+        self.packed_key = packed_key or compress_key
+        self.compress_key = compress_key
+        self.lsb_bits = lsb_bits
+        self.use_alpha = use_alpha
+        self.text_hash = text_hash
+        self.shard = shard
+        self.symbol_bits = symbol_bits
+        self.file_type = file_type
+        self.compress_level = compress_level
+
+        if self.lsb_bits not in (1, 2, 3, 4):
+            raise ValueError('Unsupported capacity mode: lsb_bits must be between 1 and 4')
+        if self.compress_level not in range(10):
+            raise ValueError('compress_level must be between 0 and 9')
+
+        if isinstance(self.image_where_to_hide, Image.Image):
+            #decoded images are used as they are, the result is always saved as PNG
+            self.image_object = self.image_where_to_hide
+        elif isinstance(self.image_where_to_hide, bytes):
+            self.image_object = Image.open(BytesIO(self.image_where_to_hide))
+        elif self.image_where_to_hide != '':
             #open image and made a copy to work with
             self.image_object = Image.open(self.image_where_to_hide, 'r')
+            if self.image_object.format == 'JPEG':
+                raise ValueError('JPEG format incompatible with steganography')
 
+        if self.image_where_to_hide != '':
             #check if image is valid for stego
             if self.image_object.mode not in ('RGB', 'RGBA', 'CMYK'):
                 raise ValueError('Unsupported pixel format: image must be RGB, RGBA, or CMYK')
-            if self.image_object.format == 'JPEG':
-                raise ValueError('JPEG format incompatible with steganography')
+            if self.use_alpha and self.image_object.mode != 'RGBA':
+                raise ValueError('Unsupported capacity mode: alpha channel needs an RGBA image')
 
 
-    def hide_information(self):
+    def hide_information(self, output = None):
         """
         Method to hide a key 
         into the given image
+
+        :param output: optional, path or binary file-like object where to save the PNG,
+                       by default <image name>_hide.png for images given by path.
+        :return: the output where the image was saved.
         """
         
         #first of all is to change original cover file metadata
         #because if we do it later, bits will be changed and key 
         # will not be recovered
 
-        _tmp_image = self.image_object.copy()
-
-        max_with = _tmp_image.size[0] - 1
-        (coord_x, coord_y) = (0, 0)
+        key = self.key_to_hide
+        if self.packed_key:
+            #every byte of the packed key is hidden as one character
+            key = pack_key(key, compress=self.compress_key).decode("latin-1")
 
-        for pixel in self.encode_imdata(_tmp_image.getdata(), self.key_to_hide):
-            _tmp_image.putpixel((coord_x, coord_y), pixel)
-            if (coord_x == max_with):
-                coord_x = 0
-                coord_y += 1
-            else:
-                coord_x += 1
+        instrumentation.count("hidden_chars", len(key))
+        with instrumentation.stage("lsb_embed"):
+            #only the rows holding key bits are copied, changed and pasted back
+            box = (0, 0, self.image_object.size[0], self.key_rows(len(key)))
+            original_rows = self.image_object.crop(box)
+            hidden_rows = Image.fromarray(self.encode_imarray(np.array(original_rows), key,
+                                                             self.lsb_bits, self.use_alpha),
+                                          self.image_object.mode)
 
         #save the resulting image
         #image_format = self.image_where_to_hide.split(".")[1]
         image_format = "png"
-        f_name = self.image_where_to_hide.split(".")[0]+"_hide." + image_format
+        if output is None:
+            if not isinstance(self.image_where_to_hide, str):
+                raise ValueError('output needed to save images not given by path')
+            output = self.image_where_to_hide.split(".")[0]+"_hide." + image_format
 
         metadata = PngInfo()
         metadata.add_text("url", self.url_metadata)
         metadata.add_text("language", self.url_language)
+        metadata.add_text("lsb_bits", str(self.lsb_bits))
+        metadata.add_text("alpha", "1" if self.use_alpha else "0")
+        if self.text_hash != '':
+            metadata.add_text("text_hash", self.text_hash)
+        if self.symbol_bits != 1:
+            metadata.add_text("symbol_bits", str(self.symbol_bits))
+        if self.file_type != '':
+            metadata.add_text("file_type", self.file_type)
+        if self.shard is not None:
+            metadata.add_text("shard", str(self.shard[0]))
+            metadata.add_text("shard_count", str(self.shard[1]))
+            metadata.add_text("key_id", self.shard[2])
+
+        try:
+            self.image_object.paste(hidden_rows, box)
+            with instrumentation.stage("png_save"):
+                self.image_object.save(output, image_format.upper(), pnginfo=metadata,
+                                       compress_level=self.compress_level, optimize=False)
+        finally:
+            #the cover is left as it was, it may be reused for other keys
+            self.image_object.paste(original_rows, box)
+
+        return output
+
+    def key_rows(self, len_key):
+        """
+        Get the rows of the image holding the bits of a key,
+        9 bits per character from the first pixel on.
+
+        :param len_key: int with the characters of the key.
+        :return: int, all the rows when the key does not fit.
+        """
+        width, height = self.image_object.size
+        used_channels = 4 if self.use_alpha else 3
+        len_pixels = -(-(-(-len_key * 9 // self.lsb_bits)) // used_channels)
 
-        _tmp_image.save(f_name, image_format.upper(), pnginfo=metadata)
+        return max(1, min(height, -(-len_pixels // width)))
 
 
     def unhide_information(self):
@@ -230,36 +692,200 @@ class ImageHiding():
         :return: str with the url to fetch the cover text
         """
 
-        key = ''
-        _image_data = iter(self.image_object.getdata())
+        lsb_bits, use_alpha = self.recover_capacity_mode()
+        with instrumentation.stage("lsb_extract"):
+            key = self.decode_blocks(self.row_blocks(), lsb_bits, use_alpha)
+        instrumentation.count("hidden_chars", len(key))
 
-        while True:
-            #get RGB values from 3 pixels of the image
-            rgb_values = list(_image_data.__next__()[:3] + 
-                              _image_data.__next__()[:3] + 
-                              _image_data.__next__()[:3]) 
-
-            char_byte = 0
-            #recover char from pixels changed bits
-            for bit_index in range(7):
-                char_byte |= rgb_values[bit_index] & 1
-                char_byte <<= 1
-            char_byte |= rgb_values[7] & 1
-
-            #convert 8 bit string to char
-            key += chr(char_byte)
-
-            if rgb_values[-1] & 1:
-                break
+        #packed keys are detected by their header, text keys are returned as they are
+        key_bytes = key.encode("latin-1")
+        if is_packed_key(key_bytes):
+            key = unpack_key(key_bytes)
 
         url, language = self.recover_metadata()
         return key, url, language
                 
 
     def recover_metadata(self):
-        url_image = PngImageFile(self.image_where_to_hide)
+        """
+        Get the source of the cover text from the PNG
+        text chunks of the already opened image.
+
+        :return: str with the url and str with the language
+        """
+        text = getattr(self.image_object, "text", self.image_object.info)
+
+        return text["url"], text["language"]
+
+    def recover_text_hash(self):
+        """
+        Get the hash of the cover text stored when hiding.
 
-        return url_image.text["url"], url_image.text["language"]
+        :return: str with the hash, empty for images without it
+        """
+        return self.image_object.info.get("text_hash", '')
+
+    def recover_file_type(self):
+        """
+        Get the mime type of the hidden file stored when hiding.
+
+        :return: str with the mime type, empty for images without it
+        """
+        return self.image_object.info.get("file_type", '')
+
+    def recover_symbol_bits(self):
+        """
+        Get the bits carried by every character of the key,
+        images without it use the original scheme of 1 bit.
+
+        :return: int
+        """
+        return int(self.image_object.info.get("symbol_bits", 1))
+
+    def recover_shard(self):
+        """
+        Get the position of the key hidden in the image
+        when it is a shard of a bigger key.
+
+        :return: tuple with index, count and id of the whole key, None for whole keys
+        """
+        info = self.image_object.info
+        if "shard" not in info:
+            return None
+
+        return int(info["shard"]), int(info["shard_count"]), info.get("key_id", '')
+
+    def recover_capacity_mode(self):
+        """
+        Get the capacity mode stored in the image text chunks,
+        images without it use 1 LSB of the RGB channels.
+
+        :return: int with the LSBs used from every channel
+        :return: bool, True if the alpha channel is used
+        """
+        info = self.image_object.info
+        lsb_bits = int(info.get("lsb_bits", 1))
+        if lsb_bits not in (1, 2, 3, 4):
+            raise ValueError('Unsupported capacity mode: lsb_bits must be between 1 and 4')
+
+        return lsb_bits, info.get("alpha", "0") == "1"
+
+    def encode_imarray(self, image_array, key, lsb_bits = 1, use_alpha = False):
+        """
+        Vectorized version of encode_imdata. Every key character
+        takes 9 bits, its 8 bits and a last bit set only for the
+        last character, written in order over the LSBs of the
+        image channels. With 1 LSB of the RGB channels this is
+        the original layout of 3 pixels per character.
+
+        :param image_array: numpy array of the image with shape (height, width, channels).
+        :param key: str with the key to hide.
+        :param lsb_bits: optional, number of LSBs used from every channel.
+        :param use_alpha: optional, use also the 4th channel.
+        :return: numpy array with the key hidden.
+        """
+        len_key = len(key)
+        if len_key == 0:
+            raise ValueError('data is empty')
+
+        height, width, channels = image_array.shape
+        used_channels = 4 if use_alpha else 3
+        if len_key * 9 > height * width * used_channels * lsb_bits:
+            raise ValueError('data is too large for image')
+
+        # only the low byte of every character fits in the 8 data bits
+        key_bytes = (np.frombuffer(key.encode("utf-32-le"), dtype = "<u4") & 0xFF).astype("uint8")
+
+        bits = np.zeros((len_key, 9), dtype = "uint8")
+        bits[:, :8] = np.unpackbits(key_bytes).reshape(len_key, 8)
+        bits[-1, 8] = 1
+
+        # group the bits stream in lsb_bits values, most significant first
+        bits = np.concatenate((bits.ravel(), np.zeros(-bits.size % lsb_bits, dtype = "uint8")))
+        shifts = np.arange(lsb_bits - 1, -1, -1, dtype = "uint8")
+        lsb_values = (bits.reshape(-1, lsb_bits) << shifts).sum(axis = 1, dtype = "uint8")
+
+        len_values = lsb_values.size
+        len_pixels = -(-len_values // used_channels)
+
+        pixels = image_array.reshape(-1, channels)
+        values = pixels[:len_pixels, :used_channels].reshape(-1)
+        clear_mask = (0xFF << lsb_bits) & 0xFF
+        values[:len_values] = (values[:len_values] & clear_mask) | lsb_values
+        pixels[:len_pixels, :used_channels] = values.reshape(len_pixels, used_channels)
+
+        return image_array
+
+    def decode_imarray(self, image_array, lsb_bits = 1, use_alpha = False, block_pixels = 9 * 2 ** 16):
+        """
+        Vectorized extraction of a key hidden with encode_imarray
+        or encode_imdata. The image is read by blocks of pixels,
+        the bits of every block are grouped by 9 at once and the
+        key ends on the first group with its 9th bit set.
+
+        :param image_array: numpy array of the image with shape (height, width, channels).
+        :param lsb_bits: optional, number of LSBs used from every channel.
+        :param use_alpha: optional, use also the 4th channel.
+        :param block_pixels: optional, pixels read each time, must be a multiple of 9.
+        :return: str with the key.
+        """
+        height, width, channels = image_array.shape
+        pixels = image_array.reshape(-1, channels)
+
+        return self.decode_blocks((pixels[start:start + block_pixels]
+                                   for start in range(0, pixels.shape[0], block_pixels)), lsb_bits, use_alpha)
+
+    def row_blocks(self, block_pixels = 9 * 2 ** 16):
+        """
+        Get the pixels of the image by bands of rows, a
+        multiple of 9 rows so every band but the last one
+        holds a whole number of 9 bits groups. Only the
+        band being read is copied out of the image.
+
+        :param block_pixels: optional, approximate pixels of every band.
+        :return: generator of numpy arrays with shape (pixels, channels).
+        """
+        width, height = self.image_object.size
+        rows = 9 * max(1, block_pixels // (9 * width))
+
+        for top in range(0, height, rows):
+            band = np.asarray(self.image_object.crop((0, top, width, min(height, top + rows))))
+            yield band.reshape(-1, band.shape[-1])
+
+    def decode_blocks(self, blocks, lsb_bits = 1, use_alpha = False):
+        """
+        Extract a key from consecutive blocks of pixels,
+        all of them but the last one of a multiple of 9
+        pixels. The bits of every block are grouped by 9
+        at once and the key ends on the first group with
+        its 9th bit set, the rest of the blocks are not read.
+
+        :param blocks: iterable of numpy arrays with shape (pixels, channels).
+        :param lsb_bits: optional, number of LSBs used from every channel.
+        :param use_alpha: optional, use also the 4th channel.
+        :return: str with the key.
+        """
+        used_channels = 4 if use_alpha else 3
+        lsb_mask = (1 << lsb_bits) - 1
+        key_bytes = []
+
+        # blocks of a multiple of 9 pixels hold a whole number of 9 bits groups
+        for pixels in blocks:
+            lsb_values = pixels[:, :used_channels].reshape(-1, 1) & lsb_mask
+            bits = np.unpackbits(lsb_values, axis = 1)[:, 8 - lsb_bits:].ravel()
+            groups = bits[:bits.size - bits.size % 9].reshape(-1, 9)
+
+            terminators = groups[:, 8]
+            if terminators.any():
+                len_key = int(np.argmax(terminators)) + 1
+                key_bytes.append(np.packbits(groups[:len_key, :8], axis = 1).ravel())
+                break
+            key_bytes.append(np.packbits(groups[:, :8], axis = 1).ravel())
+        else:
+            raise ValueError('no key found in image')
+
+        #every byte is the code point of a key character
+        return np.concatenate(key_bytes).tobytes().decode("latin-1")
 
     def encode_imdata(self, image_data, key):
         '''given a sequence of pixels, returns an iterator of pixels with
@@ -302,18 +928,18 @@ if __name__ == '__main__':
     '''
     try:
         import crawler
-        source = crawler.SourceFinding(source_language="es")
-        url, source = source.generate()
+        cover = crawler.SourceFinding(source_language="es").generate()
 
-        print("Cover fetched from: %s" % url)
+        print("Cover fetched from: %s" % cover.url)
 
-        ph = ParagraphsHiding('cover.txt', file_to_hide='secret.txt')
+        ph = ParagraphsHiding(text_where_to_hide=cover.text, file_to_hide='secret.txt',
+                              cover_index=cover.cover_index)
         key = ph.hide_information()
         print("File to hide: %s" % ('secret.txt'))
         print("Key: %s" % (key))
 
-        ih = ImageHiding('cover.png', key_to_hide=key, url_metadata=url, url_language=source)
-        ih.hide_information()
+        ih = ImageHiding(cover.image, key_to_hide=key, url_metadata=cover.url, url_language=cover.language)
+        ih.hide_information('cover_hide.png')
         print("Key hidden in cover_hide.png")
 
         uh = ImageHiding('cover_hide.png')
@@ -321,19 +947,13 @@ if __name__ == '__main__':
         print("Recovered URL: %s (language: %s)" % (url, language))
         print("Recovered key: %s" % key)
 
-        
-        uSource = crawler.SourceFinding()
-        if language == "es":
-            uSource.get_source_es(url)
-        elif language == "en":
-            uSource.get_source_en(url)
-        else:
-            uSource.get_source_ru(url)
-
+        # only the text of the cover is needed to unhide
+        cover = crawler.SourceFinding(source_url=url, source_language=language).generate(fetch_image=False)
 
-        dh = ParagraphsHiding('cover.txt',key=key, file_to_unhide='secret_unhide.txt')
-        dh.unhide_information()
+        dh = ParagraphsHiding(text_where_to_hide=cover.text, key=key, file_to_unhide='secret_unhide.txt',
+                              cover_index=cover.cover_index)
+        unhidden = dh.unhide_information()
         print("Key (again): %s" % (key))
-        print("File unhidden: %s" % ('secret.txt'))
+        print("File unhidden: %s" % (unhidden))
     except NotValidTextException as ne:
-        print(ne)'''
\ No newline at end of file
+        print(ne)'''
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+'''
+Python tool to hide information inside of text through a key.
+
+File: test_async_crawler.py
+
+@authors:
+    - David Regueira
+    - Santiago Rocha
+    - Eduardo Blazquez
+    - Jorge Sanchez
+'''
+
+
+""" AsyncSourceFinding against a local server with saved pages """
+
+import os, sys, threading, unittest
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "kagenokotoba"))
+
+from async_crawler import AsyncSourceFinding
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class FixturesHandler(SimpleHTTPRequestHandler):
+    """ Serve the fixtures directory, quietly """
+
+    def translate_path(self, path):
+        return os.path.join(FIXTURES_DIR, path.split("?")[0].lstrip("/"))
+
+    def log_message(self, *args):
+        pass
+
+
+class FixturesServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestAsyncSourceFinding(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixturesServer(("127.0.0.1", 0), FixturesHandler)
+        cls.base_url = "http://127.0.0.1:%d/" % (cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_prefetch_covers(self):
+        with AsyncSourceFinding(listing_urls={"es": self.base_url + "listing.html"}) as finder:
+            covers = finder.prefetch_covers(3, languages=("es",))
+
+        self.assertEqual(finder.errors, [])
+        self.assertEqual(len(covers), 3)
+        for cover in covers:
+            self.assertEqual(cover.url, self.base_url + "story.html")
+            self.assertEqual(cover.language, "es")
+            self.assertIn("la tortuga le propuso una carrera", cover.text)
+            self.assertEqual(cover.image.size, (16, 12))
+
+    def test_prefetch_errors(self):
+        with AsyncSourceFinding(listing_urls={"es": self.base_url + "missing.html"}) as finder:
+            covers = finder.prefetch_covers(2, languages=("es",))
+
+        self.assertEqual(covers, [])
+        self.assertEqual(len(finder.errors), 2)
+        for language, error in finder.errors:
+            self.assertEqual(language, "es")
+            self.assertIn("404", str(error))
+
+
+if __name__ == "__main__":
+    unittest.main()